@@ -1,12 +1,671 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import partial
+
 import streamlit as st
 import pandas as pd
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 import plotly.express as px
-import plotly.graph_objects as go
+
+from asarti_datos import (
+    COLUMNAS_DETALLE,
+    COLUMNAS_FECHA,
+    bloques_detalle,
+    combinar_modelo,
+    combinar_rollup,
+    filtrar_modelo,
+    filtrar_rollup,
+    guardar_snapshot,
+    guardar_snapshot_rollup,
+    huella_modelo,
+    huella_rollup,
+    indexar_pedidos,
+    indexar_rollup,
+    leer_delta_modelo,
+    leer_marcas,
+    leer_modelo,
+    leer_modelo_filtrado,
+    leer_rollup,
+    leer_snapshot,
+    leer_snapshot_rollup,
+    registrar_funciones_sqlite,
+    seleccionar_lineas,
+    vista_detalle,
+)
+from asarti_exportar import FORMATOS_EXPORTACION, bloques_dataframe, exportar, nombre_archivo
+from asarti_reportes import (
+    SECCIONES,
+    agrupar_otros,
+    construir_figura,
+    consultar_reporte,
+    normalizar_filtros,
+    reportes_de_seccion,
+)
+
+
+def leer_config_db(clave, por_defecto):
+    """Lee un parámetro de conexión de ``ASARTI_DB_<CLAVE>`` o, si no está, de la sección ``[db]`` de los secrets."""
+    valor = os.getenv(f"ASARTI_DB_{clave.upper()}")
+    if valor is not None:
+        if isinstance(por_defecto, bool):
+            return valor == "1"
+        return type(por_defecto)(valor)
+    try:
+        return st.secrets["db"][clave]
+    except (KeyError, FileNotFoundError):
+        return por_defecto
+
 
 # Configuración de la conexión a la base de datos
-DB_URL = "mysql+pymysql://root@localhost/asartialpaca"
-engine = create_engine(DB_URL)
+DB_URL = leer_config_db("url", "mysql+pymysql://root@localhost/asartialpaca")
+POOL_SIZE = leer_config_db("pool_size", 5)
+POOL_MAX_OVERFLOW = leer_config_db("max_overflow", 10)
+POOL_RECYCLE = leer_config_db("pool_recycle", 1800)  # segundos
+POOL_PRE_PING = leer_config_db("pool_pre_ping", True)
+POOL_TIMEOUT = leer_config_db("pool_timeout", 30)  # segundos
+DB_STATEMENT_TIMEOUT = leer_config_db("statement_timeout", 60000)  # milisegundos (solo MySQL)
+
+
+@st.cache_resource
+def obtener_engine():
+    """Crea el engine una sola vez por proceso; todas las sesiones y reruns comparten su pool."""
+    connect_args = {}
+    if make_url(DB_URL).get_backend_name() == "mysql":
+        connect_args["init_command"] = f"SET SESSION MAX_EXECUTION_TIME = {int(DB_STATEMENT_TIMEOUT)}"
+    engine = create_engine(
+        DB_URL,
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+        pool_timeout=POOL_TIMEOUT,
+        connect_args=connect_args,
+    )
+    if engine.dialect.name == "sqlite":
+        registrar_funciones_sqlite(engine)
+    return engine
+
+
+@st.cache_resource
+def obtener_metricas_pool():
+    """Contadores compartidos de uso del pool (entregas, esperas y tiempo de espera)."""
+    return {"entregas": 0, "esperas": 0, "espera_total": 0.0, "espera_max": 0.0, "lock": threading.Lock()}
+
+
+@contextmanager
+def conectar():
+    """Pide una conexión al pool y registra cuánto tardó en entregarla."""
+    metricas = obtener_metricas_pool()
+    pool = engine.pool
+    saturado = isinstance(pool, QueuePool) and pool.checkedout() >= pool.size() + POOL_MAX_OVERFLOW
+    inicio = time.perf_counter()
+    with engine.connect() as conn:
+        espera = time.perf_counter() - inicio
+        with metricas["lock"]:
+            metricas["entregas"] += 1
+            metricas["espera_total"] += espera
+            metricas["espera_max"] = max(metricas["espera_max"], espera)
+            if saturado:
+                metricas["esperas"] += 1
+        yield conn
+
+
+engine = obtener_engine()
+
+# Perfilado de cada rerun: panel de administración, cantidad de reruns guardados y exportaciones
+PERFIL_ACTIVO = os.getenv("ASARTI_PERFIL", "0") == "1"
+PERFIL_RERUNS = int(os.getenv("ASARTI_PERFIL_RERUNS", "20"))
+PERFIL_LOG = os.getenv("ASARTI_PERFIL_LOG")  # archivo JSON lines, un rerun por línea
+PERFIL_PROM = os.getenv("ASARTI_PERFIL_PROM")  # archivo de texto para Prometheus
+
+# Tramos medidos en el rerun actual (el script se vuelve a ejecutar en cada rerun)
+inicio_rerun = time.perf_counter()
+tramos = []
+
+
+@contextmanager
+def medir(nombre, tipo):
+    """Mide un tramo del rerun (consulta, transformación o render).
+
+    El bloque recibe el diccionario del tramo y puede anotar ``filas`` y ``bytes``.
+    """
+    tramo = {"nombre": nombre, "tipo": tipo, "ms": None, "filas": None, "bytes": None}
+    inicio = time.perf_counter()
+    try:
+        yield tramo
+    finally:
+        tramo["ms"] = (time.perf_counter() - inicio) * 1000
+        tramos.append(tramo)
+
+
+@st.cache_resource
+def obtener_perfil():
+    """Historial compartido de los últimos reruns y acumulados por tramo para exportar."""
+    return {"reruns": deque(maxlen=PERFIL_RERUNS), "acumulado": {}, "lock": threading.Lock()}
+
+
+def texto_prometheus(perfil):
+    """Acumulados por tramo en el formato de texto de Prometheus."""
+    familias = {
+        "asarti_tramo_segundos_total": ("Tiempo acumulado por tramo del dashboard.", lambda n, ms: f"{ms / 1000:.6f}"),
+        "asarti_tramo_ejecuciones_total": ("Cantidad de veces que se midió cada tramo.", lambda n, ms: f"{n}"),
+    }
+    lineas = []
+    for metrica, (ayuda, valor) in familias.items():
+        lineas += [f"# HELP {metrica} {ayuda}", f"# TYPE {metrica} counter"]
+        for (tipo, nombre), (ejecuciones, ms) in sorted(perfil["acumulado"].items()):
+            nombre = nombre.replace("\\", "\\\\").replace('"', '\\"')
+            lineas.append(f'{metrica}{{tipo="{tipo}",nombre="{nombre}"}} {valor(ejecuciones, ms)}')
+    return "\n".join(lineas) + "\n"
+
+
+def registrar_rerun():
+    """Guarda los tramos del rerun en el historial y en los archivos de exportación configurados."""
+    perfil = obtener_perfil()
+    registro = {
+        "momento": datetime.now().isoformat(timespec="seconds"),
+        "total_ms": (time.perf_counter() - inicio_rerun) * 1000,
+        "tramos": list(tramos),
+    }
+    with perfil["lock"]:
+        perfil["reruns"].append(registro)
+        for tramo in registro["tramos"]:
+            acumulado = perfil["acumulado"].setdefault((tramo["tipo"], tramo["nombre"]), [0, 0.0])
+            acumulado[0] += 1
+            acumulado[1] += tramo["ms"]
+        if PERFIL_LOG:
+            with open(PERFIL_LOG, "a", encoding="utf-8") as archivo:
+                archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        if PERFIL_PROM:
+            temporal = f"{PERFIL_PROM}.tmp"
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                archivo.write(texto_prometheus(perfil))
+            os.replace(temporal, PERFIL_PROM)
+    return perfil, registro
+
+
+def mostrar_dataframe(nombre, datos, **kwargs):
+    """``st.dataframe`` medido, con filas y (si el perfil está activo) bytes enviados."""
+    with medir(nombre, "render") as tramo:
+        tramo["filas"] = len(datos)
+        if PERFIL_ACTIVO:
+            tramo["bytes"] = int(datos.memory_usage(deep=True).sum())
+        st.dataframe(datos, **kwargs)
+
+
+def mostrar_figura(nombre, fig):
+    """``st.plotly_chart`` medido, con puntos y (si el perfil está activo) tamaño del JSON de la figura."""
+    with medir(nombre, "render") as tramo:
+        tramo["filas"] = sum(len(traza.x) for traza in fig.data if getattr(traza, "x", None) is not None)
+        if PERFIL_ACTIVO:
+            tramo["bytes"] = len(fig.to_json())
+        st.plotly_chart(fig, use_container_width=True)
+
+# Configuración de la caché de datos (compartida entre todas las sesiones del proceso)
+CACHE_TTL = int(os.getenv("ASARTI_CACHE_TTL", "600"))  # segundos
+CACHE_MAX_ENTRIES = int(os.getenv("ASARTI_CACHE_MAX_ENTRIES", "4"))
+CACHE_MAX_FILTROS = int(os.getenv("ASARTI_CACHE_MAX_FILTROS", "64"))
+CACHE_MAX_REPORTES = int(os.getenv("ASARTI_CACHE_MAX_REPORTES", "256"))
+
+# Pico de memoria de la carga del modelo con tracemalloc (1). Apagado por defecto:
+# tracemalloc hace más lenta cada asignación de todo el proceso mientras mide
+MEDIR_MEMORIA = os.getenv("ASARTI_MEDIR_MEMORIA", "0") == "1"
+
+# Aplicar los filtros del sidebar en memoria con el índice de filtros (0) o en MySQL (1).
+# En MySQL no se carga el modelo completo: se leen solo los pedidos filtrados
+FILTROS_EN_SQL = os.getenv("ASARTI_FILTROS_SQL", "0") == "1"
+
+# Ejecución concurrente de los reportes
+REPORTES_WORKERS = int(os.getenv("ASARTI_REPORTES_WORKERS", "4"))
+REPORTES_TIMEOUT = float(os.getenv("ASARTI_REPORTES_TIMEOUT", "30"))  # segundos
+
+# Caché de figuras (las series máximas y el umbral de WebGL se configuran en asarti_reportes)
+CACHE_MAX_FIGURAS = int(os.getenv("ASARTI_CACHE_MAX_FIGURAS", "256"))
+
+# Reconstrucción completa periódica del resumen diario de ventas
+ROLLUP_RECONSTRUIR = int(os.getenv("ASARTI_ROLLUP_RECONSTRUIR", "86400"))  # segundos
+
+# Sincronizar el modelo por marcas de agua (1) o recargarlo completo en cada ventana de caché (0),
+# y cada cuánto reconciliarlo con una lectura completa (recoge modificaciones y bajas)
+SYNC_INCREMENTAL = os.getenv("ASARTI_SYNC_INCREMENTAL", "1") == "1"
+MODELO_RECONCILIAR = int(os.getenv("ASARTI_MODELO_RECONCILIAR", "86400"))  # segundos
+
+# Snapshot local del modelo sincronizado para arrancar sin esperar a la base
+# (directorio vacío = desactivado) y tiempo mínimo entre escrituras
+SNAPSHOT_DIR = os.getenv("ASARTI_SNAPSHOT_DIR", ".asarti_snapshot")
+SNAPSHOT_CADA = int(os.getenv("ASARTI_SNAPSHOT_CADA", "600"))  # segundos
+HUELLA_MODELO = huella_modelo(make_url(DB_URL).render_as_string(hide_password=True))
+HUELLA_ROLLUP = huella_rollup(make_url(DB_URL).render_as_string(hide_password=True))
+
+def leer_modelo_completo():
+    """Lee todas las tablas del modelo; devuelve el modelo, sus marcas de agua y el pico de memoria en MB."""
+    trazar = MEDIR_MEMORIA and not tracemalloc.is_tracing()
+    if trazar:
+        tracemalloc.start()
+    try:
+        with conectar() as conn:
+            marcas = leer_marcas(conn)
+            modelo = leer_modelo(conn)
+        pico = tracemalloc.get_traced_memory()[1] if trazar else None
+    finally:
+        if trazar:
+            tracemalloc.stop()
+    return modelo, marcas, pico / 2**20 if pico is not None else None
+
+
+def resumir_carga(modelo, cargado_en, pico_mb):
+    """Datos de la carga que se muestran en el sidebar y se usan como versión de los datos."""
+    fechas = modelo["pedidos"]["fecha_pedido"]
+    return {
+        "cargado_en": cargado_en,
+        "fecha_min": fechas.min().date() if fechas.notna().any() else None,
+        "fecha_max": fechas.max().date() if fechas.notna().any() else None,
+        "filas": sum(len(tabla) for tabla in modelo.values()),
+        "memoria_mb": sum(tabla.memory_usage(deep=True).sum() for tabla in modelo.values()) / 2**20,
+        "pico_mb": pico_mb,
+    }
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner="Cargando datos desde la base de datos...")
+def cargar_modelo():
+    """Carga cada tabla por separado y devuelve el diccionario de DataFrames junto con datos de la carga.
+
+    El resultado se guarda en la caché del proceso, así que la base de datos se
+    consulta como máximo una vez por ventana de ``CACHE_TTL`` para todas las sesiones.
+    Los JOIN se hacen después, solo en el widget que los necesita.
+    """
+    modelo, _marcas, pico_mb = leer_modelo_completo()
+    return modelo, resumir_carga(modelo, datetime.now(), pico_mb)
+
+
+@st.cache_resource
+def obtener_modelo():
+    """Estado compartido del modelo sincronizado (un solo objeto por proceso para todas las sesiones)."""
+    return {
+        "modelo": None,
+        "carga": None,
+        "marcas": None,
+        "reconciliado_en": None,
+        "sincronizado_en": None,
+        "snapshot_en": None,
+        "snapshot_error": None,
+        "lock": threading.Lock(),
+    }
+
+
+def guardar_snapshot_modelo(estado, forzar=False):
+    """Persiste el modelo en ``SNAPSHOT_DIR``, como máximo una vez cada ``SNAPSHOT_CADA`` segundos.
+
+    Un error de escritura no interrumpe el dashboard: queda en el estado y se
+    muestra en el sidebar.
+    """
+    if not SNAPSHOT_DIR:
+        return
+    ahora = datetime.now()
+    if not forzar and estado["snapshot_en"] and ahora - estado["snapshot_en"] < timedelta(seconds=SNAPSHOT_CADA):
+        return
+    try:
+        guardar_snapshot(SNAPSHOT_DIR, estado["modelo"], estado["marcas"], HUELLA_MODELO, estado["reconciliado_en"])
+    except OSError as error:
+        estado["snapshot_error"] = str(error)
+    else:
+        estado["snapshot_en"] = ahora
+        estado["snapshot_error"] = None
+
+
+def sincronizar_modelo(estado):
+    """Trae las filas posteriores a las marcas del estado y las incorpora (con el lock ya tomado)."""
+    ahora = datetime.now()
+    with conectar() as conn:
+        marcas = leer_marcas(conn)
+        delta = leer_delta_modelo(conn, estado["marcas"])
+    modelo, cambios = combinar_modelo(estado["modelo"], delta)
+    if cambios:
+        carga = resumir_carga(modelo, ahora, estado["carga"]["pico_mb"])
+    else:
+        modelo = estado["modelo"]
+        carga = dict(estado["carga"])
+    carga["delta_filas"] = cambios
+    carga["sincronizado_en"] = ahora
+    estado.update(modelo=modelo, carga=carga, marcas=marcas, sincronizado_en=ahora)
+    if cambios:
+        guardar_snapshot_modelo(estado)
+
+
+def ponerse_al_dia(estado):
+    """Sincroniza en segundo plano el modelo recién leído del snapshot."""
+    with estado["lock"]:
+        sincronizar_modelo(estado)
+
+
+def actualizar_modelo(forzar=False):
+    """Devuelve el modelo en memoria, trayendo solo las filas nuevas desde las últimas marcas de agua.
+
+    Cada ``CACHE_TTL`` segundos se leen los clientes y pedidos con id mayor a la
+    marca, las facturas emitidas desde la última, y completas las tablas chicas.
+    Cada ``MODELO_RECONCILIAR`` segundos (o con ``forzar``) se vuelve a leer todo
+    para recoger filas modificadas o borradas. ``cargado_en`` solo cambia si
+    cambiaron los datos, así las cachés que dependen de la versión se conservan.
+
+    Un proceso nuevo arranca desde el snapshot local, si hay uno de esta base y
+    de este modelo, y se pone al día con la base en un hilo aparte.
+    """
+    estado = obtener_modelo()
+    # Con un modelo ya en memoria no se espera a una sincronización en curso (de otra
+    # sesión o la puesta al día del arranque): se sirve el modelo actual
+    if not estado["lock"].acquire(blocking=forzar or estado["modelo"] is None):
+        return estado["modelo"], estado["carga"]
+    try:
+        ahora = datetime.now()
+        if estado["modelo"] is None and SNAPSHOT_DIR and not forzar:
+            modelo, manifiesto = leer_snapshot(SNAPSHOT_DIR, HUELLA_MODELO)
+            if modelo is not None:
+                creado_en = manifiesto["creado_en"]
+                carga = resumir_carga(modelo, creado_en, None)
+                carga.update(delta_filas=None, sincronizado_en=creado_en, snapshot=creado_en)
+                estado.update(
+                    modelo=modelo,
+                    carga=carga,
+                    marcas=manifiesto["marcas"],
+                    reconciliado_en=manifiesto["reconciliado_en"] or creado_en,
+                    sincronizado_en=creado_en,
+                    snapshot_en=creado_en,
+                )
+                threading.Thread(target=ponerse_al_dia, args=(estado,), daemon=True).start()
+                return modelo, carga
+
+        completo = (
+            forzar
+            or estado["modelo"] is None
+            or ahora - estado["reconciliado_en"] > timedelta(seconds=MODELO_RECONCILIAR)
+        )
+        if not completo and ahora - estado["sincronizado_en"] < timedelta(seconds=CACHE_TTL):
+            return estado["modelo"], estado["carga"]
+
+        if completo:
+            with st.spinner("Cargando datos desde la base de datos..."):
+                modelo, marcas, pico_mb = leer_modelo_completo()
+            carga = resumir_carga(modelo, ahora, pico_mb)
+            carga.update(delta_filas=None, sincronizado_en=ahora)
+            estado.update(
+                modelo=modelo, carga=carga, marcas=marcas, reconciliado_en=ahora, sincronizado_en=ahora
+            )
+            guardar_snapshot_modelo(estado, forzar=True)
+        else:
+            sincronizar_modelo(estado)
+        return estado["modelo"], estado["carga"]
+    finally:
+        estado["lock"].release()
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def cargar_opciones_filtro():
+    """Obtiene los valores de los filtros con consultas DISTINCT baratas, sin cargar los pedidos."""
+    with conectar() as conn:
+        ciudades = conn.execute(text(
+            "SELECT DISTINCT ciudad FROM cliente WHERE ciudad IS NOT NULL ORDER BY ciudad"
+        )).scalars().all()
+        productos = conn.execute(text(
+            "SELECT DISTINCT nombre_producto FROM producto WHERE nombre_producto IS NOT NULL ORDER BY nombre_producto"
+        )).scalars().all()
+        categorias = conn.execute(text(
+            "SELECT DISTINCT nombre_categoria FROM categoria WHERE nombre_categoria IS NOT NULL ORDER BY nombre_categoria"
+        )).scalars().all()
+        fecha_min, fecha_max = conn.execute(text(
+            "SELECT MIN(fecha_pedido), MAX(fecha_pedido) FROM pedido"
+        )).one()
+    return {
+        "ciudades": ciudades,
+        "productos": productos,
+        "categorias": categorias,
+        "fecha_min": pd.to_datetime(fecha_min).date() if fecha_min is not None else None,
+        "fecha_max": pd.to_datetime(fecha_max).date() if fecha_max is not None else None,
+    }
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_FILTROS, show_spinner="Consultando datos filtrados...")
+def cargar_modelo_filtrado(ciudades, productos, categorias, fecha_inicio, fecha_fin):
+    """Lee de la base el modelo con solo los pedidos que cumplen los filtros, sin cargar el modelo completo.
+
+    Los filtros llegan como tuplas ordenadas para que la misma combinación
+    reutilice la entrada de la caché sin importar el orden de selección.
+    """
+    with conectar() as conn:
+        modelo = leer_modelo_filtrado(conn, ciudades, productos, categorias, fecha_inicio, fecha_fin)
+    return modelo, resumir_carga(modelo, datetime.now(), None)
+
+
+def resumen_memoria(carga):
+    """Texto del sidebar con el tamaño del modelo en memoria."""
+    memoria = f"{carga['filas']:,} filas · {carga['memoria_mb']:.1f} MB en memoria"
+    if carga["pico_mb"] is not None:
+        memoria += f" · pico de carga {carga['pico_mb']:.1f} MB"
+    return memoria
+
+
+# Las fechas siguen como datetime64; el formato se aplica en el navegador, solo al mostrarlas
+FORMATO_FECHAS = {columna: st.column_config.DateColumn(format="YYYY-MM-DD") for columna in COLUMNAS_FECHA}
+TAMANOS_PAGINA = [25, 50, 100, 250]
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def obtener_indice_pedidos(_modelo, version):
+    """Índice de filtros de los pedidos, armado una vez por versión de los datos (``_modelo`` no se hashea)."""
+    return indexar_pedidos(_modelo)
+
+
+def mostrar_tabla_paginada(clave, construir):
+    """Muestra una tabla paginada en el servidor: solo la página actual viaja al navegador.
+
+    ``construir`` arma el DataFrame completo y solo se llama aquí, cuando la tabla
+    se abre. El filtro por columna y el orden se resuelven en pandas antes de cortar
+    la página.
+    """
+    col_orden, col_sentido, col_filtro, col_texto, col_tamano = st.columns([3, 2, 3, 3, 2])
+    with col_orden:
+        columna_orden = st.selectbox("Ordenar por", ["(sin orden)"] + COLUMNAS_DETALLE, key=f"{clave}_orden")
+    with col_sentido:
+        descendente = st.toggle("Descendente", key=f"{clave}_descendente")
+    with col_filtro:
+        columna_filtro = st.selectbox("Filtrar columna", COLUMNAS_DETALLE, key=f"{clave}_columna_filtro")
+    with col_texto:
+        texto_filtro = st.text_input("Contiene", key=f"{clave}_texto_filtro")
+    with col_tamano:
+        tamano = st.selectbox("Filas por página", TAMANOS_PAGINA, key=f"{clave}_tamano")
+
+    with medir(f"{clave}:vista", "transformacion") as tramo:
+        datos = construir()
+        tramo["filas"] = len(datos)
+    if texto_filtro:
+        datos = datos[datos[columna_filtro].astype(str).str.contains(texto_filtro, case=False, na=False, regex=False)]
+    if columna_orden != "(sin orden)":
+        datos = datos.sort_values(columna_orden, ascending=not descendente, na_position="last")
+
+    total_paginas = max(1, -(-len(datos) // tamano))
+    clave_pagina = f"{clave}_pagina"
+    if st.session_state.get(clave_pagina, 1) > total_paginas:
+        st.session_state[clave_pagina] = total_paginas
+    pagina = st.number_input("Página", min_value=1, max_value=total_paginas, step=1, key=clave_pagina)
+
+    inicio = (pagina - 1) * tamano
+    mostrar_dataframe(clave, datos.iloc[inicio:inicio + tamano], column_config=FORMATO_FECHAS, hide_index=True)
+    if datos.empty:
+        st.caption("No hay filas que coincidan con el filtro.")
+    else:
+        st.caption(f"Filas {inicio + 1}-{min(inicio + tamano, len(datos))} de {len(datos):,} · página {pagina} de {total_paginas}")
+
+
+def boton_descarga(clave, nombre, bloques):
+    """Botón para descargar lo que entrega ``bloques()`` en el formato elegido en el sidebar.
+
+    El archivo se arma por bloques recién cuando se pulsa, en un hilo aparte del
+    script, y la página no se vuelve a ejecutar.
+    """
+    formato = formato_descarga
+    st.download_button(
+        f"⬇️ Descargar {FORMATOS_EXPORTACION[formato]['etiqueta']}",
+        data=lambda: exportar(bloques(), formato),
+        file_name=nombre_archivo(nombre, formato),
+        mime=FORMATOS_EXPORTACION[formato]["mime"],
+        key=f"descargar:{clave}",
+        on_click="ignore",
+    )
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_FIGURAS, show_spinner=False)
+def figura_ventas_por_producto(ventas_por_producto):
+    """Gráfico de barras de ventas por producto (memorizado por el contenido del agregado)."""
+    fig = px.bar(
+        agrupar_otros(ventas_por_producto, "nombre_producto", "total_pedido"),
+        x="nombre_producto",
+        y="total_pedido",
+        title="Ventas por Producto",
+        color="nombre_producto",
+        color_discrete_sequence=px.colors.qualitative.Prism
+    )
+    fig.update_layout(
+        title_font=dict(color="#005F5B"),
+        plot_bgcolor="#4B0000",
+        paper_bgcolor="#4B0000"
+    )
+    return fig
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_FIGURAS, show_spinner=False)
+def figura_ventas_por_ciudad(ventas_por_ciudad):
+    """Gráfico circular de ventas por ciudad (memorizado por el contenido del agregado)."""
+    fig = px.pie(
+        agrupar_otros(ventas_por_ciudad, "ciudad", "total_pedido"),
+        names="ciudad",
+        values="total_pedido",
+        title="Ventas por Ciudad",
+        color_discrete_sequence=px.colors.sequential.Plasma
+    )
+    fig.update_layout(
+        title_font=dict(color="#005F5B"),
+        plot_bgcolor="#4B0000",
+        paper_bgcolor="#4B0000"
+    )
+    return fig
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_FIGURAS, show_spinner=False)
+def figura_categorias_ventas(categorias_ventas):
+    """Treemap de ventas por categoría (memorizado por el contenido del agregado)."""
+    fig = px.treemap(
+        categorias_ventas,
+        path=["nombre_categoria"],
+        values="total_pedido",
+        title="Relación entre Categorías y Ventas",
+        color="total_pedido",
+        color_continuous_scale="Rainbow"
+    )
+    fig.update_layout(
+        title_x=0.5,
+        title_font_color="#005F5B",
+        plot_bgcolor="#4B0000",
+        paper_bgcolor="#4B0000"
+    )
+    return fig
+
+
+@st.cache_resource
+def obtener_rollup():
+    """Estado compartido del resumen diario (un solo objeto por proceso para todas las sesiones)."""
+    return {
+        "datos": None,
+        "marca_agua": 0,
+        "indice": None,
+        "reconstruido_en": None,
+        "actualizado_en": None,
+        "snapshot_en": None,
+        "snapshot_error": None,
+        "lock": threading.Lock(),
+    }
+
+
+def guardar_snapshot_resumen(estado, forzar=False):
+    """Persiste el resumen en ``SNAPSHOT_DIR``, como máximo una vez cada ``SNAPSHOT_CADA`` segundos."""
+    if not SNAPSHOT_DIR:
+        return
+    ahora = datetime.now()
+    if not forzar and estado["snapshot_en"] and ahora - estado["snapshot_en"] < timedelta(seconds=SNAPSHOT_CADA):
+        return
+    try:
+        guardar_snapshot_rollup(
+            SNAPSHOT_DIR, estado["datos"], estado["marca_agua"], HUELLA_ROLLUP, estado["reconstruido_en"]
+        )
+    except OSError as error:
+        estado["snapshot_error"] = str(error)
+    else:
+        estado["snapshot_en"] = ahora
+        estado["snapshot_error"] = None
+
+
+def actualizar_rollup(forzar=False):
+    """Devuelve el resumen diario y su índice de filtros, trayendo solo los pedidos nuevos.
+
+    Cada ``CACHE_TTL`` segundos se consultan los pedidos con ``id_pedido`` mayor a la
+    marca de agua y se suman al resumen. Cada ``ROLLUP_RECONSTRUIR`` segundos (o con
+    ``forzar``) se reconstruye desde cero para recoger pedidos modificados. El índice
+    se rearma solo cuando cambian los datos.
+
+    Un proceso nuevo parte del resumen guardado en el snapshot local y solo
+    consulta los pedidos posteriores a su marca de agua.
+    """
+    estado = obtener_rollup()
+    with estado["lock"]:
+        ahora = datetime.now()
+        if estado["datos"] is None and SNAPSHOT_DIR and not forzar:
+            datos, manifiesto = leer_snapshot_rollup(SNAPSHOT_DIR, HUELLA_ROLLUP)
+            if datos is not None:
+                estado.update(
+                    datos=datos,
+                    marca_agua=manifiesto["marcas"]["id_pedido"],
+                    indice=indexar_rollup(datos),
+                    reconstruido_en=manifiesto["reconciliado_en"] or manifiesto["creado_en"],
+                    actualizado_en=manifiesto["creado_en"],
+                    snapshot_en=manifiesto["creado_en"],
+                )
+        completo = (
+            forzar
+            or estado["datos"] is None
+            or ahora - estado["reconstruido_en"] > timedelta(seconds=ROLLUP_RECONSTRUIR)
+        )
+        if not completo and ahora - estado["actualizado_en"] < timedelta(seconds=CACHE_TTL):
+            return estado["datos"], estado["indice"]
+
+        desde = 0 if completo else estado["marca_agua"]
+        with conectar() as conn:
+            nuevos, hasta = leer_rollup(conn, desde)
+
+        if completo:
+            datos = nuevos
+            estado["reconstruido_en"] = ahora
+        elif nuevos.empty:
+            datos = estado["datos"]
+        else:
+            datos = combinar_rollup(estado["datos"], nuevos)
+        cambio = datos is not estado["datos"]
+        if cambio:
+            estado["indice"] = indexar_rollup(datos)
+        estado["datos"] = datos
+        estado["marca_agua"] = hasta
+        estado["actualizado_en"] = ahora
+        if cambio:
+            guardar_snapshot_resumen(estado, forzar=completo)
+        return datos, estado["indice"]
+
 
 # Configuración de la página
 st.set_page_config(page_title="Asartialpaca Dashboard", layout="wide", page_icon=":bar_chart:")
@@ -69,30 +728,44 @@ st.sidebar.markdown(
 )
 st.sidebar.header("🔍 Filtros de búsqueda")
 
-# Consulta general para cargar datos iniciales
-with engine.connect() as conn:
-    query = text(""" 
-        SELECT
-            c.id_cliente, c.nombre_cliente, c.apellido_cliente, c.ciudad, DATE(c.fecha_registro) AS fecha_registro,
-            p.id_pedido, DATE(p.fecha_pedido) AS fecha_pedido, p.total_pedido, p.direccion_envio,
-            pr.id_producto, pr.nombre_producto, pr.precio_producto,
-            cat.nombre_categoria, inv.cantidad_disponible, inv.id_ubicacion_almacen,
-            f.monto_total, DATE(f.fecha_emision) AS fecha_emision, f.razon_social
-        FROM cliente c
-        LEFT JOIN pedido p ON c.id_cliente = p.id_cliente
-        LEFT JOIN pedido_producto pp ON p.id_pedido = pp.id_pedido
-        LEFT JOIN producto pr ON pp.id_producto = pr.id_producto
-        LEFT JOIN categoria cat ON pr.id_categoria = cat.id_categoria
-        LEFT JOIN inventario inv ON pr.id_producto = inv.id_producto
-        LEFT JOIN facturacion f ON f.id_detalle_pedido = p.id_pedido
-    """)
-    result = conn.execute(query)
-    df = pd.DataFrame(result.fetchall(), columns=result.keys())
-
-# Filtros de búsqueda
-ciudades = df["ciudad"].dropna().unique()
-productos = df["nombre_producto"].dropna().unique()
-categorias = df["nombre_categoria"].dropna().unique()
+# Refrescar manualmente los datos en caché
+refrescar = st.sidebar.button("🔄 Actualizar datos")
+if refrescar:
+    st.cache_data.clear()
+
+# Filtros de búsqueda. Con los filtros en SQL no hay modelo completo en memoria: las
+# opciones salen de consultas DISTINCT y los pedidos filtrados se leen más abajo
+if FILTROS_EN_SQL:
+    with medir("opciones_filtro", "consulta"):
+        opciones = cargar_opciones_filtro()
+    ciudades = opciones["ciudades"]
+    productos = opciones["productos"]
+    categorias = opciones["categorias"]
+    fecha_min, fecha_max = opciones["fecha_min"], opciones["fecha_max"]
+else:
+    with medir("modelo", "consulta") as tramo:
+        if SYNC_INCREMENTAL:
+            modelo, carga = actualizar_modelo(forzar=refrescar)
+        else:
+            modelo, carga = cargar_modelo()
+        tramo["filas"] = carga["filas"]
+    if SYNC_INCREMENTAL:
+        sincronizacion = f"Datos al {carga['sincronizado_en']:%Y-%m-%d %H:%M:%S} (se sincronizan cada {CACHE_TTL} s"
+        if carga["delta_filas"] is not None:
+            sincronizacion += f"; última: {carga['delta_filas']:,} filas nuevas o modificadas"
+        elif carga.get("snapshot"):
+            sincronizacion += "; arranque desde el snapshot local, poniéndose al día"
+        st.sidebar.caption(sincronizacion + ")")
+        if obtener_modelo()["snapshot_error"]:
+            st.sidebar.caption(f"⚠ No se pudo guardar el snapshot: {obtener_modelo()['snapshot_error']}")
+    else:
+        st.sidebar.caption(f"Datos cargados: {carga['cargado_en']:%Y-%m-%d %H:%M:%S} (se renuevan cada {CACHE_TTL} s)")
+    st.sidebar.caption(resumen_memoria(carga))
+
+    ciudades = modelo["clientes"]["ciudad"].dropna().unique()
+    productos = modelo["productos"]["nombre_producto"].dropna().unique()
+    categorias = modelo["productos"]["nombre_categoria"].dropna().unique()
+    fecha_min, fecha_max = carga["fecha_min"], carga["fecha_max"]
 
 filtro_ciudad = st.sidebar.multiselect("Selecciona Ciudad 🏙", ciudades)
 filtro_producto = st.sidebar.multiselect("Selecciona Producto 🛒", productos)
@@ -100,52 +773,81 @@ filtro_categoria = st.sidebar.multiselect("Selecciona Categoría 📂", categori
 
 # Filtro por rango de fechas (por fecha de pedido)
 st.sidebar.subheader("📅 Rango de Fechas")
-fecha_inicio = st.sidebar.date_input("Fecha de Inicio", value=pd.to_datetime(df["fecha_pedido"]).min())
-fecha_fin = st.sidebar.date_input("Fecha de Fin", value=pd.to_datetime(df["fecha_pedido"]).max())
-
-# Aplicar filtros
-df_filtrado = df.copy()
-if filtro_ciudad:
-    df_filtrado = df_filtrado[df_filtrado["ciudad"].isin(filtro_ciudad)]
-if filtro_producto:
-    df_filtrado = df_filtrado[df_filtrado["nombre_producto"].isin(filtro_producto)]
-if filtro_categoria:
-    df_filtrado = df_filtrado[df_filtrado["nombre_categoria"].isin(filtro_categoria)]
-if fecha_inicio and fecha_fin:
-    df_filtrado = df_filtrado[(df_filtrado["fecha_pedido"] >= fecha_inicio) & (df_filtrado["fecha_pedido"] <= fecha_fin)]
-
-# Ajuste del formato de las fechas
-df["fecha_pedido"] = pd.to_datetime(df["fecha_pedido"]).dt.strftime("%Y-%m-%d")
-df["fecha_registro"] = pd.to_datetime(df["fecha_registro"]).dt.strftime("%Y-%m-%d")
-df["fecha_emision"] = pd.to_datetime(df["fecha_emision"]).dt.strftime("%Y-%m-%d")
-df_filtrado["fecha_pedido"] = pd.to_datetime(df_filtrado["fecha_pedido"]).dt.strftime("%Y-%m-%d")
-df_filtrado["fecha_registro"] = pd.to_datetime(df_filtrado["fecha_registro"]).dt.strftime("%Y-%m-%d")
-df_filtrado["fecha_emision"] = pd.to_datetime(df_filtrado["fecha_emision"]).dt.strftime("%Y-%m-%d")
-
-# Mostrar datos iniciales
+fecha_inicio = st.sidebar.date_input("Fecha de Inicio", value=fecha_min)
+fecha_fin = st.sidebar.date_input("Fecha de Fin", value=fecha_max)
+
+# Formato de las descargas de datos filtrados y reportes
+st.sidebar.subheader("⬇️ Descargas")
+formato_descarga = st.sidebar.selectbox(
+    "Formato", list(FORMATOS_EXPORTACION), format_func=lambda formato: FORMATOS_EXPORTACION[formato]["etiqueta"]
+)
+
+# Aplicar filtros: primero se eligen los pedidos y sus líneas, sin unir tablas
+with medir("filtros", "transformacion") as tramo:
+    if FILTROS_EN_SQL:
+        with medir("modelo_filtrado", "consulta"):
+            modelo, carga = cargar_modelo_filtrado(
+                tuple(sorted(filtro_ciudad)),
+                tuple(sorted(filtro_producto)),
+                tuple(sorted(filtro_categoria)),
+                fecha_inicio,
+                fecha_fin,
+            )
+        # El modelo ya trae solo los pedidos filtrados y sus líneas
+        pedidos_filtrados = modelo["pedidos"]
+        lineas_filtradas = seleccionar_lineas(modelo, filtro_producto, filtro_categoria)
+    else:
+        indice_pedidos = obtener_indice_pedidos(modelo, carga["cargado_en"])
+        pedidos_filtrados, lineas_filtradas = filtrar_modelo(
+            modelo, indice_pedidos, filtro_ciudad, filtro_producto, filtro_categoria, fecha_inicio, fecha_fin
+        )
+    tramo["filas"] = len(pedidos_filtrados)
+if FILTROS_EN_SQL:
+    st.sidebar.caption(f"Datos consultados: {carga['cargado_en']:%Y-%m-%d %H:%M:%S} (se renuevan cada {CACHE_TTL} s)")
+    st.sidebar.caption(resumen_memoria(carga))
+
+# Resumen diario filtrado para las métricas y gráficos de ventas
+with medir("rollup", "consulta") as tramo:
+    rollup, indice_rollup = actualizar_rollup(forzar=refrescar)
+    tramo["filas"] = len(rollup)
+if obtener_rollup()["snapshot_error"]:
+    st.sidebar.caption(f"⚠ No se pudo guardar el resumen en el snapshot: {obtener_rollup()['snapshot_error']}")
+with medir("rollup_filtrado", "transformacion") as tramo:
+    rollup_filtrado = filtrar_rollup(
+        rollup, filtro_ciudad, filtro_producto, filtro_categoria, fecha_inicio, fecha_fin, indice=indice_rollup
+    )
+    tramo["filas"] = len(rollup_filtrado)
+
+# Mostrar datos iniciales (la tabla solo se arma y se envía si el usuario la abre)
 st.subheader("📋 Datos Iniciales")
-with st.expander("Ver datos iniciales"):
-    st.dataframe(df)
+if st.toggle("Ver datos iniciales"):
+    # Con los filtros en SQL el modelo completo se lee solo si se pide esta tabla
+    mostrar_tabla_paginada("datos_iniciales", lambda: vista_detalle(cargar_modelo()[0] if FILTROS_EN_SQL else modelo))
 
 # Mostrar datos filtrados
 st.subheader("📋 Datos Filtrados")
-if df_filtrado.empty:
+if pedidos_filtrados.empty:
     st.error("⚠ No hay datos disponibles para los filtros seleccionados.")
 else:
-    with st.expander("Ver datos filtrados"):
-        st.dataframe(df_filtrado)
+    boton_descarga("datos_filtrados", "datos_filtrados", partial(bloques_detalle, modelo, pedidos_filtrados, lineas_filtradas))
+    if st.toggle("Ver datos filtrados"):
+        mostrar_tabla_paginada("datos_filtrados", lambda: vista_detalle(modelo, pedidos_filtrados, lineas_filtradas))
 
 # Métricas generales
 st.header("📈 Indicadores Clave")
 col1, col2, col3 = st.columns(3)
+with medir("indicadores", "transformacion"):
+    total_ventas = rollup_filtrado["total_pedido"].sum()
+    inventario = modelo["inventario"]
+    cantidad_productos = inventario.loc[
+        inventario["id_producto"].isin(lineas_filtradas["id_producto"]), "cantidad_disponible"
+    ].sum()
+    clientes_registrados = pedidos_filtrados["id_cliente"].nunique()
 with col1:
-    total_ventas = df_filtrado["total_pedido"].sum()
     st.metric("Total Ventas 💰", f"Bs. {total_ventas:,.2f}")
 with col2:
-    cantidad_productos = df_filtrado["cantidad_disponible"].sum()
     st.metric("Cantidad Disponible 📦", cantidad_productos)
 with col3:
-    clientes_registrados = df_filtrado["id_cliente"].nunique()
     st.metric("Clientes Registrados 👥", clientes_registrados)
 
 # Gráficos dinámicos con filtros aplicados
@@ -156,347 +858,227 @@ col4, col5 = st.columns(2)
 with col4:
     st.markdown('<h3 style="color: #E6D5BE;">Ventas por Producto 🛒</h3>', unsafe_allow_html=True)
     
-    if df_filtrado.empty or "total_pedido" not in df_filtrado.columns or df_filtrado["total_pedido"].sum() == 0:
+    if rollup_filtrado.empty or rollup_filtrado["total_pedido"].sum() == 0:
         st.warning("⚠ No hay suficientes datos para generar el gráfico de Ventas por Producto.")
     else:
-        ventas_por_producto = df_filtrado.groupby("nombre_producto")["total_pedido"].sum().reset_index()
-        fig1 = px.bar(
-            ventas_por_producto, 
-            x="nombre_producto", 
-            y="total_pedido", 
-            title="Ventas por Producto", 
-            color="nombre_producto", 
-            color_discrete_sequence=px.colors.qualitative.Prism
-        )
-        fig1.update_layout(
-            title_font=dict(color="#005F5B"),
-            plot_bgcolor="#4B0000", 
-            paper_bgcolor="#4B0000"
-        )
-        st.plotly_chart(fig1, use_container_width=True)
+        with medir("ventas_por_producto", "transformacion"):
+            ventas_por_producto = rollup_filtrado.groupby("nombre_producto", observed=True)["total_pedido"].sum().reset_index()
+            fig = figura_ventas_por_producto(ventas_por_producto)
+        mostrar_figura("ventas_por_producto", fig)
 
 # Ventas por Ciudad
 with col5:
     st.markdown('<h3 style="color: #E6D5BE;">Distribución de Ventas por Ciudad 🏙</h3>', unsafe_allow_html=True)
     
-    if df_filtrado.empty or "ciudad" not in df_filtrado.columns or df_filtrado["total_pedido"].sum() == 0:
+    if rollup_filtrado.empty or rollup_filtrado["total_pedido"].sum() == 0:
         st.warning("⚠ No hay suficientes datos para generar el gráfico de Distribución de Ventas por Ciudad.")
     else:
-        ventas_por_ciudad = df_filtrado.groupby("ciudad")["total_pedido"].sum().reset_index()
-        fig2 = px.pie(
-            ventas_por_ciudad, 
-            names="ciudad", 
-            values="total_pedido", 
-            title="Ventas por Ciudad", 
-            color_discrete_sequence=px.colors.sequential.Plasma
-        )
-        fig2.update_layout(
-            title_font=dict(color="#005F5B"),
-            plot_bgcolor="#4B0000", 
-            paper_bgcolor="#4B0000"
-        )
-        st.plotly_chart(fig2, use_container_width=True)
+        with medir("ventas_por_ciudad", "transformacion"):
+            ventas_por_ciudad = rollup_filtrado.groupby("ciudad", observed=True)["total_pedido"].sum().reset_index()
+            fig = figura_ventas_por_ciudad(ventas_por_ciudad)
+        mostrar_figura("ventas_por_ciudad", fig)
 
 # Relación entre Categorías y Ventas
 st.markdown('<h3 style="color: #E6D5BE;">📊 Relación entre Categorías y Ventas</h3>', unsafe_allow_html=True)
-if df_filtrado.empty or "nombre_categoria" not in df_filtrado.columns or "total_pedido" not in df_filtrado.columns:
+if rollup_filtrado.empty:
     st.warning("⚠ No hay suficientes datos para generar el gráfico de Relación entre Categorías y Ventas.")
 else:
-    categorias_ventas = df_filtrado.groupby("nombre_categoria")["total_pedido"].sum().reset_index()
-    fig_relacion = px.treemap(
-        categorias_ventas,
-        path=["nombre_categoria"],
-        values="total_pedido",
-        title="Relación entre Categorías y Ventas",
-        color="total_pedido",
-        color_continuous_scale="Rainbow"
-    )
-    fig_relacion.update_layout(
-        title_x=0.5,
-        title_font_color="#005F5B",
-        plot_bgcolor="#4B0000",
-        paper_bgcolor="#4B0000"
-    )
-    st.plotly_chart(fig_relacion, use_container_width=True)
-
-# Diccionario de consultas
-report_queries = {
-    "Ventas Totales por Cliente": """
-        SELECT c.nombre_cliente, CONCAT(c.nombre_cliente, ' ', c.apellido_cliente) AS cliente, 
-               SUM(p.total_pedido) AS total_compras
-        FROM cliente AS c
-        JOIN pedido AS p ON c.id_cliente = p.id_cliente
-        GROUP BY c.id_cliente
-        ORDER BY total_compras DESC;
-    """,
-    "Cantidad de Productos Vendidos por Categoría": """
-        SELECT cat.nombre_categoria, SUM(dp.cantidad_producto) AS total_vendidos
-        FROM categoria AS cat
-        JOIN producto AS prod ON cat.id_categoria = prod.id_categoria
-        JOIN detalle_pedido AS dp ON prod.id_producto = dp.id_cliente_pedido
-        GROUP BY cat.id_categoria
-        ORDER BY total_vendidos DESC;
-    """,
-    "Descuento Promedio en Promociones": """
-        SELECT nombre_promocion, AVG(porcentaje_descuento) AS descuento_promedio
-        FROM promocion
-        GROUP BY nombre_promocion
-        ORDER BY descuento_promedio DESC;
-    """,
-    "Estado de Pedidos por Método de Pago": """
-        SELECT metodo_pago, estado_final_pedido, COUNT(id_historial) AS total_pedidos
-        FROM historial
-        GROUP BY metodo_pago, estado_final_pedido
-        ORDER BY total_pedidos DESC;
-    """,
-    "Monto Total Facturado por Mes": """
-        SELECT DATE_FORMAT(fecha_emision, '%Y-%m') AS mes, SUM(monto_total) AS total_facturado
-        FROM facturacion
-        GROUP BY mes
-        ORDER BY mes DESC;
-    """,
-    "Promedio de Compra por Cliente": """
-        SELECT c.nombre_cliente, c.apellido_cliente, AVG(p.total_pedido) AS promedio_compra
-        FROM cliente c
-        JOIN pedido p ON c.id_cliente = p.id_cliente
-        GROUP BY c.id_cliente
-        ORDER BY promedio_compra DESC;
-    """,
-    "Productos más Vendidos": """
-        SELECT p.nombre_producto, SUM(dp.cantidad_producto) AS total_vendido
-        FROM pedido_producto pp
-        JOIN producto p ON pp.id_producto = p.id_producto
-        JOIN detalle_pedido dp ON dp.id_cliente_pedido = pp.id_pedido
-        GROUP BY p.nombre_producto
-        ORDER BY total_vendido DESC;
-    """,
-    "Empleados por Cargo": """
-        SELECT ce.nombre_cargo, COUNT(e.id_empleado) AS total_empleados
-        FROM cargo_empleado ce
-        JOIN empleado e ON ce.id_cargo_empleado = e.id_cargo_empleado
-        GROUP BY ce.id_cargo_empleado
-        ORDER BY total_empleados DESC;
-    """,
-    "Historial de Estados de Carritos de Compras": """
-        SELECT estado_carrito, COUNT(id_carrito_compras) AS total_carritos
-        FROM carrito_compras
-        GROUP BY estado_carrito
-        ORDER BY total_carritos DESC;
-    """,
-    "Ingresos Generados por Promociones": """
-        SELECT p.nombre_promocion, SUM(p.porcentaje_descuento * dp.cantidad_producto * pr.precio_producto / 100) AS ingresos_promocion
-        FROM promocion AS p
-        JOIN producto AS pr ON p.id_producto = pr.id_producto
-        JOIN pedido_producto AS pp ON pr.id_producto = pp.id_producto
-        JOIN detalle_pedido AS dp ON pp.id_pedido = dp.id_cliente_pedido
-        GROUP BY p.id_promocion
-        ORDER BY ingresos_promocion DESC;
+    with medir("categorias_ventas", "transformacion"):
+        categorias_ventas = rollup_filtrado.groupby("nombre_categoria", observed=True)["total_pedido"].sum().reset_index()
+        fig = figura_categorias_ventas(categorias_ventas)
+    mostrar_figura("categorias_ventas", fig)
+
+
+@st.cache_resource
+def obtener_cache_reportes():
+    """Resultados de reportes compartidos por todas las sesiones, del más al menos reciente en uso.
+
+    La clave es (reporte, filtros normalizados, versión de los datos): una
+    combinación de filtros ya consultada se muestra sin ir a la base, y al
+    cambiar la versión las entradas viejas dejan de usarse y salen por LRU.
+    """
+    return {"resultados": OrderedDict(), "aciertos": 0, "consultas": 0, "lock": threading.Lock()}
+
+
+def leer_cache_reporte(clave):
+    """Devuelve el resultado guardado para ``clave`` (o ``None``) y lo marca como recién usado."""
+    cache = obtener_cache_reportes()
+    with cache["lock"]:
+        report_df = cache["resultados"].get(clave)
+        if report_df is None:
+            return None
+        cache["resultados"].move_to_end(clave)
+        cache["aciertos"] += 1
+        return report_df
+
+
+def guardar_cache_reporte(clave, report_df):
+    """Guarda un resultado y desaloja los menos usados por encima de ``CACHE_MAX_REPORTES``."""
+    cache = obtener_cache_reportes()
+    with cache["lock"]:
+        cache["consultas"] += 1
+        cache["resultados"][clave] = report_df
+        cache["resultados"].move_to_end(clave)
+        while len(cache["resultados"]) > CACHE_MAX_REPORTES:
+            cache["resultados"].popitem(last=False)
+
+
+def ejecutar_reporte(report_name, filtros):
+    """Ejecuta una consulta de reporte en su propia conexión del pool (se llama desde un hilo)."""
+    with medir(f"reporte:{report_name}", "consulta"), conectar() as conn:
+        if engine.dialect.name != "mysql":
+            return consultar_reporte(conn, report_name, filtros)
+        # Límite del lado del servidor para que un reporte lento no retenga la conexión;
+        # al terminar se restaura el límite general porque la conexión vuelve al pool
+        conn.execute(text("SET SESSION MAX_EXECUTION_TIME = :ms"), {"ms": int(REPORTES_TIMEOUT * 1000)})
+        try:
+            return consultar_reporte(conn, report_name, filtros)
+        finally:
+            conn.execute(text("SET SESSION MAX_EXECUTION_TIME = :ms"), {"ms": int(DB_STATEMENT_TIMEOUT)})
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_FIGURAS, show_spinner=False)
+def figura_reporte(report_name, report_df):
+    """Construye la figura de un reporte; se memoriza por nombre y contenido del resultado."""
+    return construir_figura(report_name, report_df)
+
+
+def mostrar_reporte(report_name, report_df):
+    """Dibuja la tabla y el gráfico asociado a un reporte ya ejecutado."""
+    # Mostrar datos en Streamlit con color de título verde
+    col1, col2 = st.columns([2, 3])
+    with col1:
+        st.markdown(f"<h4 style='color:#E6D5BE;'>{report_name}</h4>", unsafe_allow_html=True)
+        
+        if report_df.empty:
+            st.warning(f"⚠ No hay suficientes datos disponibles para el reporte: {report_name}.")
+        else:
+            mostrar_dataframe(f"reporte:{report_name}", report_df, use_container_width=True)
+            boton_descarga(f"reporte:{report_name}", report_name, partial(bloques_dataframe, report_df))
+
+    # Generar gráficos personalizados si hay datos disponibles
+    with col2:
+        if report_df.empty:
+            st.warning(f"⚠ No hay datos para generar el gráfico asociado a: {report_name}.")
+        else:
+            with medir(f"figura:{report_name}", "transformacion"):
+                fig = figura_reporte(report_name, report_df)
+            mostrar_figura(f"figura:{report_name}", fig)
+
+
+def mostrar_reportes(nombres, filtros, version):
+    """Muestra los reportes dados con los filtros activos.
+
+    Los que ya están en la caché para estos filtros y esta versión de los datos
+    se dibujan enseguida; el resto se consulta en paralelo y se muestra apenas
+    termina.
     """
+    # Reservar un contenedor por reporte para conservar el orden mientras llegan los resultados
+    contenedores = {}
+    claves = {}
+    pendientes = []
+    for report_name in nombres:
+        contenedores[report_name] = st.empty()
+        claves[report_name] = (report_name, normalizar_filtros(report_name, filtros), version)
+        report_df = leer_cache_reporte(claves[report_name])
+        if report_df is None:
+            contenedores[report_name].info(f"⏳ Cargando reporte: {report_name}...")
+            pendientes.append(report_name)
+        else:
+            with contenedores[report_name].container():
+                mostrar_reporte(report_name, report_df)
+    if not pendientes:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=REPORTES_WORKERS)
+    futuros = {executor.submit(ejecutar_reporte, report_name, filtros): report_name for report_name in pendientes}
+    try:
+        for futuro in as_completed(futuros, timeout=REPORTES_TIMEOUT):
+            report_name = futuros[futuro]
+            with contenedores[report_name].container():
+                try:
+                    report_df = futuro.result()
+                except Exception as error:
+                    st.error(f"⚠ No se pudo ejecutar el reporte {report_name}: {error}")
+                else:
+                    guardar_cache_reporte(claves[report_name], report_df)
+                    mostrar_reporte(report_name, report_df)
+    except FuturesTimeoutError:
+        for futuro, report_name in futuros.items():
+            if not futuro.done():
+                contenedores[report_name].warning(
+                    f"⚠ El reporte {report_name} superó el tiempo límite de {REPORTES_TIMEOUT:g} s."
+                )
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Los reportes usan los mismos filtros del sidebar; un rango de fechas que cubre
+# todos los pedidos no filtra nada y comparte la entrada de caché sin fechas
+rango_completo = fecha_min is not None and fecha_inicio <= fecha_min and fecha_fin >= fecha_max
+filtros_reportes = {
+    "ciudades": filtro_ciudad,
+    "productos": filtro_producto,
+    "categorias": filtro_categoria,
+    "fecha_inicio": None if rango_completo else fecha_inicio,
+    "fecha_fin": None if rango_completo else fecha_fin,
 }
-with engine.connect() as conn:
-    for report_name, query in report_queries.items():
-        # Ejecutar consulta y convertir resultado a DataFrame
-        result = conn.execute(text(query))
-        report_df = pd.DataFrame(result.fetchall(), columns=result.keys())
-
-        # Mostrar datos en Streamlit con color de título verde
-        col1, col2 = st.columns([2, 3])
-        with col1:
-            st.markdown(f"<h4 style='color:#E6D5BE;'>{report_name}</h4>", unsafe_allow_html=True)
-            
-            if report_df.empty:
-                st.warning(f"⚠ No hay suficientes datos disponibles para el reporte: {report_name}.")
-            else:
-                st.dataframe(report_df, use_container_width=True)
-
-        # Generar gráficos personalizados si hay datos disponibles
-        with col2:
-            if report_df.empty:
-                st.warning(f"⚠ No hay datos para generar el gráfico asociado a: {report_name}.")
-            else:
-                if "Ventas Totales por Cliente" in report_name:
-                    # Mapa de Calor
-                    fig = px.density_heatmap(
-                        report_df,
-                        x="cliente",
-                        y="total_compras",
-                        z="total_compras",
-                        title="Mapa de Calor: Ventas Totales por Cliente",
-                        color_continuous_scale="Spectral"
-                    )
-                    fig.update_layout(
-                        title_x=0.5,
-                        title_font_color="#005F5B",
-                        plot_bgcolor="#4B0000",  # Fondo del gráfico
-                        paper_bgcolor="#4B0000",  # Fondo del área del gráfico
-                        font=dict(color="white")  # Asegura que el texto sea visible en el fondo oscuro
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-                elif "Cantidad de Productos Vendidos" in report_name:
-                    # Gráfico de Barras
-                    fig = px.bar(
-                        report_df,
-                        x="nombre_categoria",
-                        y="total_vendidos",
-                        title="Gráfico de Barras: Productos Vendidos por Categoría",
-                        text_auto=True,
-                        color="nombre_categoria",
-                        color_discrete_sequence=px.colors.qualitative.Dark2
-                    )
-                    fig.update_layout(
-                        title_x=0.5,
-                        title_font_color="#005F5B",
-                        plot_bgcolor="#4B0000",  
-                        paper_bgcolor="#4B0000"  
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-                elif "Descuento Promedio" in report_name:
-                    # Gráfico de Dispersión con Línea de Tendencia
-                    fig = px.scatter(
-                        report_df,
-                        x="nombre_promocion",
-                        y="descuento_promedio",
-                        title="Gráfico de Dispersión: Descuento Promedio",
-                        trendline="ols",
-                        color="nombre_promocion",
-                        color_discrete_sequence=px.colors.qualitative.Bold
-                    )
-                    fig.update_layout(
-                        title_x=0.5,
-                        title_font_color="#005F5B",
-                        plot_bgcolor="#4B0000",  
-                        paper_bgcolor="#4B0000"  
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-                elif "Estado de Pedidos" in report_name:
-                    # Gráfico Circular (Sunburst)
-                    fig = px.sunburst(
-                        report_df,
-                        path=["metodo_pago", "estado_final_pedido"],
-                        values="total_pedidos",
-                        title="Sunburst: Estado de Pedidos por Método de Pago",
-                        color="total_pedidos",
-                        color_continuous_scale="Inferno"
-                    )
-                    fig.update_layout(
-                        title_x=0.5,
-                        title_font_color="#005F5B",
-                        plot_bgcolor="#4B0000",  
-                        paper_bgcolor="#4B0000"  
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-                elif "Monto Total Facturado" in report_name:
-                    # Gráfico de Área
-                    fig = px.area(
-                        report_df,
-                        x="mes",
-                        y="total_facturado",
-                        title="Gráfico de Área: Monto Total Facturado por Mes",
-                        color_discrete_sequence=["#3E4B8D"]
-                    )
-                    fig.update_layout(
-                        title_x=0.5,
-                        title_font_color="#005F5B",
-                        plot_bgcolor="#4B0000",  
-                        paper_bgcolor="#4B0000"  
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-                elif "Promedio de Compra" in report_name:
-                    # Convertir tamaño a numérico
-                    report_df["promedio_compra"] = pd.to_numeric(report_df["promedio_compra"], errors="coerce")
-                    # Gráfico de Burbuja
-                    fig = px.scatter(
-                        report_df,
-                        x="nombre_cliente",
-                        y="promedio_compra",
-                        size="promedio_compra",
-                        color="nombre_cliente",
-                        title="Gráfico de Burbuja: Promedio de Compra por Cliente",
-                        color_discrete_sequence=px.colors.qualitative.Set1  
-                    )
-                    fig.update_traces(marker=dict(opacity=1))
-
-                    fig.update_layout(
-                        title_x=0.5,
-                        title_font_color="#005F5B",
-                        plot_bgcolor="#4B0000",  
-                        paper_bgcolor="#4B0000"  
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-                elif "Productos más Vendidos" in report_name:
-                    # Gráfico de Barras Apiladas
-                    fig = px.bar(
-                        report_df,
-                        x="nombre_producto",
-                        y="total_vendido",
-                        color="nombre_producto",
-                        title="Gráfico de Barras Apiladas: Productos Más Vendidos",
-                        text_auto=True,
-                        color_discrete_sequence=px.colors.qualitative.Vivid
-                    )
-                    fig.update_layout(
-                        title_x=0.5,
-                        title_font_color="#005F5B",
-                        plot_bgcolor="#4B0000",  
-                        paper_bgcolor="#4B0000"  
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-                elif "Empleados por Cargo" in report_name:
-                    # Gráfico Circular
-                    fig = px.pie(
-                        report_df,
-                        names="nombre_cargo",
-                        values="total_empleados",
-                        title="Gráfico Circular: Empleados por Cargo",
-                        color_discrete_sequence=px.colors.qualitative.Dark24
-                    )
-                    fig.update_layout(
-                        title_x=0.5,
-                        title_font_color="#005F5B",
-                        plot_bgcolor="#4B0000",  
-                        paper_bgcolor="#4B0000"  
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-                elif "Historial de Estados de Carritos" in report_name:
-                    # Histograma
-                    fig = px.histogram(
-                        report_df,
-                        x="estado_carrito",
-                        y="total_carritos",
-                        title="Histograma: Estados de Carritos de Compras",
-                        color="estado_carrito",
-                        color_discrete_sequence=px.colors.sequential.Plasma
-                    )
-                    fig.update_layout(
-                        title_x=0.5,
-                        title_font_color="#005F5B",
-                        plot_bgcolor="#4B0000",  
-                        paper_bgcolor="#4B0000"  
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-                elif "Ingresos Generados por Promociones" in report_name:
-                    # Box Plot
-                    fig = px.box(
-                        report_df,
-                        x="nombre_promocion",
-                        y="ingresos_promocion",
-                        title="Gráfico Box Plot: Ingresos Generados por Promociones",
-                        color="nombre_promocion",
-                        color_discrete_sequence=px.colors.qualitative.Pastel
-                    )
-                    fig.update_layout(
-                        title_x=0.5,
-                        title_font_color="#005F5B",
-                        plot_bgcolor="#4B0000", 
-                        paper_bgcolor="#4B0000"  
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+# Versión de los datos: cambia cuando se recarga el modelo, entran pedidos nuevos o
+# pasa un CACHE_TTL (la sincronización no mira empleados, historial, promociones,
+# carritos ni detalle de pedido, así que esos reportes vencen por tiempo).
+# Con ASARTI_CACHE_TTL=0 no se reutiliza nada entre ejecuciones.
+ventana_cache = int(time.time() // CACHE_TTL) if CACHE_TTL > 0 else time.time()
+version_datos = (carga["cargado_en"], obtener_rollup()["marca_agua"], ventana_cache)
+
+# Una pestaña por sección; solo se ejecutan las consultas de la pestaña abierta
+pestanas = st.tabs(SECCIONES, key="seccion_reportes", on_change="rerun")
+for seccion, pestana in zip(SECCIONES, pestanas):
+    if pestana.open:
+        with pestana:
+            mostrar_reportes(reportes_de_seccion(seccion), filtros_reportes, version_datos)
+
+# Estado del pool de conexiones compartido (al final, para incluir las consultas de este rerun)
+with st.sidebar.expander("🔌 Pool de conexiones"):
+    metricas_pool = obtener_metricas_pool()
+    if isinstance(engine.pool, QueuePool):
+        st.caption(
+            f"En uso: {engine.pool.checkedout()} · libres: {engine.pool.checkedin()} · "
+            f"desborde: {max(engine.pool.overflow(), 0)} / {POOL_MAX_OVERFLOW} (tamaño {engine.pool.size()})"
+        )
+    else:
+        st.caption(engine.pool.status())
+    promedio = metricas_pool["espera_total"] / metricas_pool["entregas"] if metricas_pool["entregas"] else 0.0
+    st.caption(
+        f"Entregas: {metricas_pool['entregas']:,} · con pool lleno: {metricas_pool['esperas']:,} · "
+        f"espera promedio {promedio * 1000:.1f} ms · máxima {metricas_pool['espera_max'] * 1000:.1f} ms"
+    )
+    cache_reportes = obtener_cache_reportes()
+    st.caption(
+        f"Reportes en caché: {len(cache_reportes['resultados']):,} / {CACHE_MAX_REPORTES} · "
+        f"desde caché: {cache_reportes['aciertos']:,} · consultados: {cache_reportes['consultas']:,}"
+    )
+
+# Tiempos del rerun: siempre se registran; el panel solo se muestra con ASARTI_PERFIL=1
+perfil, registro = registrar_rerun()
+if PERFIL_ACTIVO:
+    with st.sidebar.expander("⏱ Tiempos del rerun"):
+        st.caption(f"Último rerun: {registro['total_ms']:,.0f} ms en {len(registro['tramos'])} tramos")
+        st.dataframe(
+            pd.DataFrame(registro["tramos"]).sort_values("ms", ascending=False),
+            hide_index=True,
+            column_config={"ms": st.column_config.NumberColumn(format="%.1f")},
+        )
+        historial = pd.DataFrame([{"momento": r["momento"], "total_ms": r["total_ms"]} for r in perfil["reruns"]])
+        st.bar_chart(historial, x="momento", y="total_ms")
+        st.download_button(
+            "Exportar Prometheus",
+            texto_prometheus(perfil),
+            file_name="asarti_metricas.prom",
+            mime="text/plain",
+        )
+        st.download_button(
+            "Exportar JSON lines",
+            "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in perfil["reruns"]),
+            file_name="asarti_tiempos.jsonl",
+            mime="application/jsonl",
+        )
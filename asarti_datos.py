@@ -0,0 +1,704 @@
+"""Consultas y transformaciones de datos del dashboard de Asartialpaca.
+
+No depende de Streamlit: ``Asarti.py`` envuelve estas funciones con su caché y
+su pool de conexiones, y ``benchmark.py`` las usa directamente.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.api.types import union_categoricals
+from pyarrow import feather
+from sqlalchemy import bindparam, event, text
+
+# Filas por bloque al leer el modelo
+CHUNK_FILAS = int(os.getenv("ASARTI_CHUNK_FILAS", "50000"))
+
+# Modelo normalizado: una consulta por tabla, sin el producto cartesiano del JOIN general
+MODELO_QUERIES = {
+    "clientes": """
+        SELECT id_cliente, nombre_cliente, apellido_cliente, ciudad, DATE(fecha_registro) AS fecha_registro
+        FROM cliente
+    """,
+    "pedidos": """
+        SELECT id_pedido, id_cliente, DATE(fecha_pedido) AS fecha_pedido, total_pedido, direccion_envio
+        FROM pedido
+    """,
+    "lineas": """
+        SELECT id_pedido, id_producto
+        FROM pedido_producto
+    """,
+    "productos": """
+        SELECT pr.id_producto, pr.nombre_producto, pr.precio_producto, cat.nombre_categoria
+        FROM producto pr
+        LEFT JOIN categoria cat ON pr.id_categoria = cat.id_categoria
+    """,
+    "inventario": """
+        SELECT id_producto, cantidad_disponible, id_ubicacion_almacen
+        FROM inventario
+    """,
+    "facturas": """
+        SELECT id_facturacion, id_detalle_pedido AS id_pedido, monto_total, DATE(fecha_emision) AS fecha_emision, razon_social
+        FROM facturacion
+    """,
+}
+
+# Columnas de la tabla detallada que se muestra en "Datos Iniciales" / "Datos Filtrados"
+COLUMNAS_DETALLE = [
+    "id_cliente", "nombre_cliente", "apellido_cliente", "ciudad", "fecha_registro",
+    "id_pedido", "fecha_pedido", "total_pedido", "direccion_envio",
+    "id_producto", "nombre_producto", "precio_producto", "nombre_categoria", "cantidad_disponible",
+    "monto_total", "fecha_emision", "razon_social",
+]
+
+# Tipos compactos por columna: los ids como enteros de 32 bits (con nulos),
+# los montos DECIMAL como float64, las fechas como datetime64 y los textos
+# repetitivos como categorías
+COLUMNAS_ENTERAS = ["id_cliente", "id_pedido", "id_producto", "cantidad_disponible", "id_ubicacion_almacen", "id_facturacion"]
+COLUMNAS_DECIMALES = ["total_pedido", "precio_producto", "monto_total"]
+COLUMNAS_FECHA = ["fecha_registro", "fecha_pedido", "fecha_emision"]
+COLUMNAS_CATEGORICAS = ["ciudad", "nombre_producto", "nombre_categoria"]
+
+
+def registrar_funciones_sqlite(engine):
+    """Agrega a SQLite las funciones de MySQL que usan los reportes (``DATE_FORMAT`` y ``CONCAT``).
+
+    Permite correr el dashboard, los reportes y el benchmark contra una copia
+    local en SQLite.
+    """
+    def date_format(valor, formato):
+        if valor is None:
+            return None
+        return datetime.fromisoformat(str(valor)).strftime(formato.replace("%i", "%M"))
+
+    def concat(*partes):
+        return None if any(parte is None for parte in partes) else "".join(str(parte) for parte in partes)
+
+    @event.listens_for(engine, "connect")
+    def _funciones(dbapi_conn, _registro):
+        dbapi_conn.create_function("DATE_FORMAT", 2, date_format)
+        dbapi_conn.create_function("CONCAT", -1, concat)
+
+
+def tipar_bloque(bloque):
+    """Convierte un bloque recién leído a los tipos compactos definidos arriba."""
+    for columna in bloque.columns:
+        if columna in COLUMNAS_ENTERAS:
+            bloque[columna] = bloque[columna].astype("Int32")
+        elif columna in COLUMNAS_DECIMALES:
+            bloque[columna] = bloque[columna].astype("float64")
+        elif columna in COLUMNAS_FECHA:
+            bloque[columna] = pd.to_datetime(bloque[columna])
+        elif columna in COLUMNAS_CATEGORICAS:
+            bloque[columna] = bloque[columna].astype("category")
+    return bloque
+
+
+def unificar_categorias(partes):
+    """Iguala el tipo de las categorías: un bloque todo NULL las trae vacías como ``object``."""
+    tipos = {parte.cat.categories.dtype for parte in partes if len(parte.cat.categories)}
+    tipo = tipos.pop() if len(tipos) == 1 else object
+    return [
+        parte if parte.cat.categories.dtype == tipo
+        else parte.cat.set_categories(parte.cat.categories.astype(tipo))
+        for parte in partes
+    ]
+
+
+def concatenar_bloques(bloques):
+    """Une los bloques conservando las categorías (``pd.concat`` las volvería texto si difieren)."""
+    if len(bloques) == 1:
+        return bloques[0]
+    columnas = {}
+    for columna in bloques[0].columns:
+        partes = [bloque[columna] for bloque in bloques]
+        if isinstance(partes[0].dtype, pd.CategoricalDtype):
+            columnas[columna] = union_categoricals(unificar_categorias(partes), ignore_order=True)
+        else:
+            columnas[columna] = pd.concat(partes, ignore_index=True)
+    return pd.DataFrame(columnas)
+
+
+def leer_bloques(conn, query, params=None):
+    """Recorre una consulta con cursor del lado del servidor y entrega DataFrames de ``CHUNK_FILAS`` filas.
+
+    Si la consulta no devuelve filas entrega un único bloque vacío con sus columnas.
+    """
+    result = conn.execution_options(stream_results=True, yield_per=CHUNK_FILAS).execute(query, params or {})
+    columnas = list(result.keys())
+    vacio = True
+    for filas in result.partitions(CHUNK_FILAS):
+        vacio = False
+        yield pd.DataFrame.from_records(filas, columns=columnas)
+    if vacio:
+        yield pd.DataFrame(columns=columnas)
+
+
+def leer_tabla(conn, query, params=None):
+    """Lee una consulta de ``CHUNK_FILAS`` en ``CHUNK_FILAS`` filas.
+
+    Cada bloque se tipa apenas llega, así nunca se tiene en memoria la lista
+    completa de tuplas junto con el DataFrame.
+    """
+    bloques = leer_bloques(conn, enlazar(query, params or {}), params)
+    return concatenar_bloques([tipar_bloque(bloque) for bloque in bloques])
+
+
+def leer_modelo(conn):
+    """Lee todas las tablas del modelo normalizado con la conexión dada."""
+    return {nombre: leer_tabla(conn, query) for nombre, query in MODELO_QUERIES.items()}
+
+
+# Sincronización incremental del modelo. Columna de última actualización del
+# inventario, si la tabla la tiene; sin ella el inventario se lee completo
+# (una fila por producto y ubicación, no crece con el historial)
+COLUMNA_INVENTARIO_ACTUALIZADO = os.getenv("ASARTI_INVENTARIO_ACTUALIZADO")
+if COLUMNA_INVENTARIO_ACTUALIZADO and not COLUMNA_INVENTARIO_ACTUALIZADO.isidentifier():
+    raise ValueError(f"ASARTI_INVENTARIO_ACTUALIZADO no es un nombre de columna: {COLUMNA_INVENTARIO_ACTUALIZADO!r}")
+
+# pedido_producto no tiene id ni fecha propios: sus líneas se sincronizan con la
+# marca de los pedidos, volviendo a leer las de los últimos VENTANA_LINEAS pedidos
+# para recoger las que se insertaron después que su pedido. Una línea que llegue
+# más tarde que eso (o una borrada) solo aparece en la reconciliación completa, y
+# el resumen diario (que solo suma pedidos nuevos) la recoge al reconstruirse.
+VENTANA_LINEAS = int(os.getenv("ASARTI_VENTANA_LINEAS", "1000"))  # pedidos
+
+# Clave de cada tabla del modelo: al unir un delta, la fila nueva reemplaza a la anterior
+CLAVES_MODELO = {
+    "clientes": ["id_cliente"],
+    "pedidos": ["id_pedido"],
+    "lineas": ["id_pedido", "id_producto"],
+    "productos": ["id_producto"],
+    "inventario": ["id_producto", "id_ubicacion_almacen"],
+    "facturas": ["id_facturacion"],
+}
+
+# Tablas que se sincronizan por marca de agua: (marca, condición de las filas nuevas o cambiadas).
+# Las demás (productos con su categoría y, sin columna de actualización, el inventario)
+# son chicas y se vuelven a leer completas.
+MODELO_INCREMENTAL = {
+    "clientes": ("id_cliente", "cliente.id_cliente > :marca"),
+    "pedidos": ("id_pedido", "pedido.id_pedido > :marca"),
+    "lineas": ("id_pedido", f"pedido_producto.id_pedido > :marca - {VENTANA_LINEAS}"),
+    "facturas": ("fecha_emision", "facturacion.fecha_emision >= :marca"),
+}
+if COLUMNA_INVENTARIO_ACTUALIZADO:
+    MODELO_INCREMENTAL["inventario"] = ("inventario", f"inventario.{COLUMNA_INVENTARIO_ACTUALIZADO} >= :marca")
+
+
+def leer_marcas(conn):
+    """Marcas de agua actuales: último cliente, último pedido, última factura y última actualización de inventario."""
+    columnas = [
+        "(SELECT MAX(id_cliente) FROM cliente) AS id_cliente",
+        "(SELECT MAX(id_pedido) FROM pedido) AS id_pedido",
+        "(SELECT MAX(fecha_emision) FROM facturacion) AS fecha_emision",
+    ]
+    if COLUMNA_INVENTARIO_ACTUALIZADO:
+        columnas.append(f"(SELECT MAX({COLUMNA_INVENTARIO_ACTUALIZADO}) FROM inventario) AS inventario")
+    return dict(conn.execute(text("SELECT " + ", ".join(columnas))).mappings().one())
+
+
+def leer_delta_modelo(conn, marcas):
+    """Lee las filas posteriores a ``marcas`` de las tablas incrementales y completas las demás.
+
+    Las marcas deben leerse antes que las filas (con ``leer_marcas``): lo que
+    entre en el medio se vuelve a traer en la próxima sincronización y la
+    clave de la tabla evita duplicarlo.
+    """
+    delta = {}
+    for nombre, query in MODELO_QUERIES.items():
+        marca, condicion = MODELO_INCREMENTAL.get(nombre, (None, None))
+        if marca is None or marcas.get(marca) is None:
+            delta[nombre] = leer_tabla(conn, query)
+        else:
+            delta[nombre] = leer_tabla(conn, f"{query} WHERE {condicion}", {"marca": marcas[marca]})
+    return delta
+
+
+# Snapshot local del modelo: un archivo Arrow IPC sin comprimir por tabla (se lee
+# con memory-map, sin copiar ni decodificar) y un manifiesto con la huella del
+# modelo, la fecha y las marcas de agua con las que se leyó
+SNAPSHOT_MANIFIESTO = "snapshot.json"
+
+
+def huella_modelo(origen):
+    """Identifica la base de origen y la forma del modelo; un snapshot con otra huella no se usa."""
+    contenido = json.dumps(
+        [origen, MODELO_QUERIES, COLUMNAS_ENTERAS, COLUMNAS_DECIMALES, COLUMNAS_FECHA, COLUMNAS_CATEGORICAS]
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:16]
+
+
+def guardar_snapshot(directorio, modelo, marcas, huella, reconciliado_en=None, nombre_manifiesto=SNAPSHOT_MANIFIESTO):
+    """Escribe las tablas tipadas y después el manifiesto, cada archivo con reemplazo atómico.
+
+    Un lector que encuentre el manifiesto ve tablas al menos tan nuevas como
+    sus marcas; lo que se repita se descarta por clave al sincronizar.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    for nombre, tabla in modelo.items():
+        ruta = os.path.join(directorio, f"{nombre}.arrow")
+        feather.write_feather(pa.Table.from_pandas(tabla, preserve_index=False), f"{ruta}.tmp", compression="uncompressed")
+        os.replace(f"{ruta}.tmp", ruta)
+    manifiesto = {
+        "huella": huella,
+        "creado_en": datetime.now().isoformat(),
+        "reconciliado_en": reconciliado_en.isoformat() if reconciliado_en else None,
+        "marcas": marcas,
+        "filas": {nombre: len(tabla) for nombre, tabla in modelo.items()},
+    }
+    ruta = os.path.join(directorio, nombre_manifiesto)
+    with open(f"{ruta}.tmp", "w", encoding="utf-8") as archivo:
+        json.dump(manifiesto, archivo, default=str, indent=2)
+    os.replace(f"{ruta}.tmp", ruta)
+    return manifiesto
+
+
+def leer_snapshot(directorio, huella=None, columnas=None, nombre_manifiesto=SNAPSHOT_MANIFIESTO):
+    """Lee el snapshot con memory-map y devuelve ``(modelo, manifiesto)``, o ``(None, None)`` si no hay uno válido.
+
+    ``columnas`` ({tabla: [columnas] o ``None``}) limita qué tablas y columnas se
+    leen, para análisis fuera del dashboard, por ejemplo::
+
+        leer_snapshot(".asarti_snapshot", columnas={"pedidos": ["fecha_pedido", "total_pedido"]})
+    """
+    try:
+        with open(os.path.join(directorio, nombre_manifiesto), encoding="utf-8") as archivo:
+            manifiesto = json.load(archivo)
+        if huella is not None and manifiesto.get("huella") != huella:
+            return None, None
+        modelo = {}
+        for nombre, seleccion in (columnas or dict.fromkeys(MODELO_QUERIES)).items():
+            ruta = os.path.join(directorio, f"{nombre}.arrow")
+            modelo[nombre] = feather.read_table(ruta, columns=seleccion, memory_map=True).to_pandas()
+    except (OSError, ValueError):
+        return None, None
+    manifiesto["creado_en"] = datetime.fromisoformat(manifiesto["creado_en"])
+    if manifiesto.get("reconciliado_en"):
+        manifiesto["reconciliado_en"] = datetime.fromisoformat(manifiesto["reconciliado_en"])
+    return modelo, manifiesto
+
+
+def filas_nuevas(tabla, delta, claves):
+    """Filas de ``delta`` que no están, idénticas, en ``tabla`` (nuevas o con algún valor distinto)."""
+    if delta.empty:
+        return delta
+    previas = tabla[pd.MultiIndex.from_frame(tabla[claves]).isin(pd.MultiIndex.from_frame(delta[claves]))]
+    cruce = delta.merge(previas.drop_duplicates(), how="left", indicator=True)
+    return delta[(cruce["_merge"] == "left_only").to_numpy()]
+
+
+def combinar_modelo(modelo, delta):
+    """Incorpora un delta al modelo; devuelve el modelo nuevo (sin tocar el anterior) y las filas que cambiaron.
+
+    En las tablas incrementales se ignoran las filas que ya estaban idénticas
+    (la marca de las facturas vuelve a traer las del último instante), las
+    nuevas se agregan y las modificadas reemplazan a la fila con su clave. Las
+    tablas leídas completas se reemplazan solo si son distintas.
+    """
+    combinado = {}
+    cambios = 0
+    for nombre, tabla in modelo.items():
+        claves = CLAVES_MODELO[nombre]
+        if nombre not in MODELO_INCREMENTAL:
+            if delta[nombre].equals(tabla):
+                combinado[nombre] = tabla
+            else:
+                combinado[nombre] = delta[nombre]
+                borradas = ~pd.MultiIndex.from_frame(tabla[claves]).isin(pd.MultiIndex.from_frame(delta[nombre][claves]))
+                cambios += len(filas_nuevas(tabla, delta[nombre], claves)) + int(borradas.sum())
+            continue
+        nuevas = filas_nuevas(tabla, delta[nombre], claves)
+        if nuevas.empty:
+            combinado[nombre] = tabla
+            continue
+        reemplazadas = pd.MultiIndex.from_frame(tabla[claves]).isin(pd.MultiIndex.from_frame(nuevas[claves]))
+        combinado[nombre] = concatenar_bloques([tabla[~reemplazadas], nuevas])
+        cambios += len(nuevas)
+    return combinado, cambios
+
+
+def enlazar(sql, params):
+    """Arma la consulta declarando como ``IN`` expandibles los parámetros que son listas."""
+    expandibles = [bindparam(nombre, expanding=True) for nombre, valor in params.items() if isinstance(valor, list)]
+    return text(sql).bindparams(*expandibles)
+
+
+def sql_pedidos_filtrados(ciudades, productos, categorias, fecha_inicio, fecha_fin):
+    """SQL y parámetros de los ``id_pedido`` que cumplen los filtros activos.
+
+    El rango de fechas se compara directamente sobre ``p.fecha_pedido`` (sin ``DATE()``)
+    para que MySQL pueda usar el índice de la columna. Los filtros de producto y
+    categoría van en un ``EXISTS`` para no multiplicar los pedidos por sus líneas.
+    """
+    condiciones = []
+    params = {}
+    if ciudades:
+        condiciones.append("c.ciudad IN :ciudades")
+        params["ciudades"] = list(ciudades)
+    if fecha_inicio and fecha_fin:
+        condiciones.append("p.fecha_pedido >= :fecha_inicio AND p.fecha_pedido < :fecha_fin")
+        params["fecha_inicio"] = fecha_inicio
+        params["fecha_fin"] = fecha_fin + timedelta(days=1)
+    if productos or categorias:
+        condiciones_linea = ["pp.id_pedido = p.id_pedido"]
+        if productos:
+            condiciones_linea.append("pr.nombre_producto IN :productos")
+            params["productos"] = list(productos)
+        if categorias:
+            condiciones_linea.append("cat.nombre_categoria IN :categorias")
+            params["categorias"] = list(categorias)
+        condiciones.append(
+            "EXISTS (SELECT 1 FROM pedido_producto pp"
+            " JOIN producto pr ON pp.id_producto = pr.id_producto"
+            " LEFT JOIN categoria cat ON pr.id_categoria = cat.id_categoria"
+            " WHERE " + " AND ".join(condiciones_linea) + ")"
+        )
+
+    sql = "SELECT p.id_pedido FROM pedido p JOIN cliente c ON c.id_cliente = p.id_cliente"
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    return sql, params
+
+
+# Filtros en SQL: cada tabla grande del modelo se lee restringida a los pedidos que
+# cumplen los filtros ({pedidos} es la consulta de ``sql_pedidos_filtrados``); el
+# catálogo y el inventario, que son chicos, se leen completos
+MODELO_FILTRADO = {
+    "clientes": "cliente.id_cliente IN (SELECT fp.id_cliente FROM pedido fp WHERE fp.id_pedido IN ({pedidos}))",
+    "pedidos": "pedido.id_pedido IN ({pedidos})",
+    "lineas": "pedido_producto.id_pedido IN ({pedidos})",
+    "facturas": "facturacion.id_detalle_pedido IN ({pedidos})",
+}
+
+
+def consultas_modelo_filtrado(ciudades, productos, categorias, fecha_inicio, fecha_fin):
+    """SQL y parámetros de cada tabla del modelo restringida a los pedidos que cumplen los filtros."""
+    pedidos, params = sql_pedidos_filtrados(ciudades, productos, categorias, fecha_inicio, fecha_fin)
+    consultas = {}
+    for nombre, query in MODELO_QUERIES.items():
+        condicion = MODELO_FILTRADO.get(nombre)
+        if condicion is None:
+            consultas[nombre] = (query, {})
+        else:
+            consultas[nombre] = (f"{query} WHERE {condicion.format(pedidos=pedidos)}", params)
+    return consultas
+
+
+def leer_modelo_filtrado(conn, ciudades, productos, categorias, fecha_inicio, fecha_fin):
+    """Lee el modelo con solo los pedidos que cumplen los filtros, resueltos en el servidor.
+
+    Tiene la misma forma que ``leer_modelo``: sus pedidos son los filtrados, con
+    sus clientes, líneas y facturas.
+    """
+    consultas = consultas_modelo_filtrado(ciudades, productos, categorias, fecha_inicio, fecha_fin)
+    return {nombre: leer_tabla(conn, query, params) for nombre, (query, params) in consultas.items()}
+
+
+def seleccionar_productos(modelo, productos, categorias):
+    """``id_producto`` del catálogo que cumplen a la vez los filtros de producto y categoría."""
+    catalogo = modelo["productos"]
+    mascara = pd.Series(True, index=catalogo.index)
+    if productos:
+        mascara &= catalogo["nombre_producto"].isin(productos)
+    if categorias:
+        mascara &= catalogo["nombre_categoria"].isin(categorias)
+    return catalogo.loc[mascara, "id_producto"]
+
+
+def seleccionar_lineas(modelo, productos, categorias):
+    """Líneas de pedido cuyos productos cumplen los filtros de producto y categoría."""
+    lineas = modelo["lineas"]
+    if not productos and not categorias:
+        return lineas
+    return lineas[lineas["id_producto"].isin(seleccionar_productos(modelo, productos, categorias))]
+
+
+# Índices de filtro: por cada valor de una dimensión, las posiciones ordenadas de
+# las filas que lo tienen, más las fechas ordenadas con su permutación. Se arman
+# una vez por versión de los datos; un filtro une las posiciones de los valores
+# elegidos, intersecta las dimensiones sobre un bitmap y busca el rango de fechas
+# con ``searchsorted``. El DataFrame se corta una sola vez, al final.
+
+def indexar_valores(valores, posiciones):
+    """Agrupa ``posiciones`` por valor: ``{valor: array ordenado de posiciones}``."""
+    valores = pd.Categorical(valores)
+    codigos = np.asarray(valores.codes)
+    posiciones = np.asarray(posiciones, dtype=np.intp)
+    orden = np.lexsort((posiciones, codigos))
+    limites = np.searchsorted(codigos[orden], np.arange(len(valores.categories) + 1))
+    posiciones = posiciones[orden]
+    return {
+        valor: posiciones[limites[i]:limites[i + 1]]
+        for i, valor in enumerate(valores.categories)
+    }
+
+
+def indexar_fechas(fechas):
+    """Fechas ordenadas y la permutación que lleva a sus filas (los nulos quedan al final)."""
+    valores = fechas.to_numpy(dtype="datetime64[ns]")
+    orden = np.argsort(valores, kind="stable")
+    return valores[orden], orden
+
+
+def indexar_rollup(rollup):
+    """Índice de filtros del resumen diario: cada fila tiene una sola ciudad, producto y categoría."""
+    posiciones = np.arange(len(rollup))
+    return {
+        "filas": len(rollup),
+        "base": None,
+        "valores": {
+            "ciudades": indexar_valores(rollup["ciudad"], posiciones),
+            "productos": indexar_valores(rollup["nombre_producto"], posiciones),
+            "categorias": indexar_valores(rollup["nombre_categoria"], posiciones),
+        },
+        "fechas": indexar_fechas(rollup["fecha_pedido"]),
+    }
+
+
+def indexar_pedidos(modelo):
+    """Índice de filtros de los pedidos.
+
+    La ciudad sale del cliente y los productos de las líneas; se indexa por
+    ``id_producto`` y no por nombre o categoría para que ambos filtros se
+    cumplan en la misma línea, como en ``filtrar_pedidos``.
+    """
+    pedidos = modelo["pedidos"]
+    clientes = modelo["clientes"]
+    posicion = pd.Series(np.arange(len(pedidos)), index=pedidos["id_pedido"].to_numpy())
+    lineas = modelo["lineas"]
+    conocidas = lineas["id_pedido"].isin(posicion.index).to_numpy()
+    lineas = lineas[conocidas]
+    pedido_de_linea = posicion.loc[lineas["id_pedido"]].to_numpy()
+    ciudades = pedidos["id_cliente"].map(clientes.set_index("id_cliente")["ciudad"])
+    # Líneas de cada pedido: posiciones de las líneas ordenadas por pedido y dónde empieza cada uno
+    orden = np.argsort(pedido_de_linea, kind="stable")
+    return {
+        "filas": len(pedidos),
+        "base": np.flatnonzero(pedidos["id_cliente"].isin(clientes["id_cliente"]).to_numpy()),
+        "valores": {
+            "ciudades": indexar_valores(ciudades, np.arange(len(pedidos))),
+            "id_producto": indexar_valores(lineas["id_producto"], pedido_de_linea),
+        },
+        "fechas": indexar_fechas(pedidos["fecha_pedido"]),
+        "lineas": (
+            np.searchsorted(pedido_de_linea[orden], np.arange(len(pedidos) + 1)),
+            np.flatnonzero(conocidas)[orden],
+        ),
+    }
+
+
+def lineas_de_pedidos(indice, posiciones):
+    """Posiciones ordenadas de las líneas de los pedidos en ``posiciones`` (de ``indexar_pedidos``)."""
+    limites, lineas = indice["lineas"]
+    inicios = limites[posiciones]
+    largos = limites[posiciones + 1] - inicios
+    # Rangos [inicio, inicio + largo) de cada pedido, concatenados sin bucle
+    saltos = np.repeat(inicios - (np.cumsum(largos) - largos), largos)
+    return np.sort(lineas[saltos + np.arange(largos.sum())])
+
+
+def intersectar(seleccion, posiciones, filas):
+    """Intersección de dos listas ordenadas de posiciones sobre un bitmap de ``filas``."""
+    if seleccion is None:
+        return posiciones
+    bitmap = np.zeros(filas, dtype=bool)
+    bitmap[seleccion] = True
+    return posiciones[bitmap[posiciones]]
+
+
+def posiciones_filtradas(indice, elegidos, fecha_inicio, fecha_fin):
+    """Resuelve un filtro con el índice y devuelve las posiciones ordenadas que lo cumplen.
+
+    ``elegidos`` es ``{dimensión: valores}``: los valores de una dimensión se
+    unen y las dimensiones se intersectan. Devuelve ``None`` si no hay ninguna
+    condición activa.
+    """
+    seleccion = indice["base"]
+    for dimension, valores in elegidos.items():
+        listas = indice["valores"][dimension]
+        partes = [listas[valor] for valor in valores if valor in listas]
+        posiciones = np.unique(np.concatenate(partes)) if partes else np.empty(0, dtype=np.intp)
+        seleccion = intersectar(seleccion, posiciones, indice["filas"])
+    if fecha_inicio and fecha_fin:
+        fechas, orden = indice["fechas"]
+        desde = np.searchsorted(fechas, np.datetime64(pd.Timestamp(fecha_inicio), "ns"), side="left")
+        hasta = np.searchsorted(fechas, np.datetime64(pd.Timestamp(fecha_fin), "ns"), side="right")
+        seleccion = intersectar(seleccion, np.sort(orden[desde:hasta]), indice["filas"])
+    return seleccion
+
+
+def filtrar_modelo(modelo, indice, ciudades, productos, categorias, fecha_inicio, fecha_fin):
+    """Pedidos y líneas que cumplen los filtros, resueltos con el índice de ``indexar_pedidos``.
+
+    Las líneas son las de los pedidos elegidos cuyo producto cumple los filtros
+    de producto y categoría, igual que ``seleccionar_lineas`` restringido a esos
+    pedidos. Cada tabla se corta una sola vez, al final.
+    """
+    elegidos = {}
+    if ciudades:
+        elegidos["ciudades"] = ciudades
+    if productos or categorias:
+        elegidos["id_producto"] = seleccionar_productos(modelo, productos, categorias).tolist()
+    posiciones = posiciones_filtradas(indice, elegidos, fecha_inicio, fecha_fin)
+    if posiciones is None:
+        posiciones = np.arange(indice["filas"])
+    lineas = modelo["lineas"].iloc[lineas_de_pedidos(indice, posiciones)]
+    if productos or categorias:
+        lineas = lineas[lineas["id_producto"].isin(elegidos["id_producto"])]
+    return modelo["pedidos"].iloc[posiciones], lineas
+
+
+def filtrar_pedidos(modelo, ciudades, productos, categorias, fecha_inicio, fecha_fin):
+    """Aplica los filtros del sidebar en pandas con máscaras y devuelve los pedidos que los cumplen.
+
+    Es la versión de referencia de ``filtrar_modelo``, que resuelve lo mismo con el índice.
+    """
+    pedidos = modelo["pedidos"]
+    mascara = pedidos["id_cliente"].isin(modelo["clientes"]["id_cliente"])
+    if ciudades:
+        clientes = modelo["clientes"]
+        mascara &= pedidos["id_cliente"].isin(clientes.loc[clientes["ciudad"].isin(ciudades), "id_cliente"])
+    if productos or categorias:
+        mascara &= pedidos["id_pedido"].isin(seleccionar_lineas(modelo, productos, categorias)["id_pedido"])
+    if fecha_inicio and fecha_fin:
+        mascara &= pedidos["fecha_pedido"].between(pd.Timestamp(fecha_inicio), pd.Timestamp(fecha_fin))
+    return pedidos[mascara]
+
+
+def vista_detalle(modelo, pedidos=None, lineas=None):
+    """Une las tablas del modelo en una fila por línea de pedido, solo para mostrarla en pantalla.
+
+    El inventario se suma por producto antes de unirlo para que las ubicaciones
+    de almacén no repitan las líneas. Sin ``pedidos`` se incluyen también los
+    clientes sin pedidos, como en la consulta general original.
+    """
+    if pedidos is None:
+        base = modelo["clientes"].merge(modelo["pedidos"], on="id_cliente", how="left")
+    else:
+        base = pedidos.merge(modelo["clientes"], on="id_cliente")
+    if lineas is None:
+        lineas = modelo["lineas"]
+    inventario = modelo["inventario"].groupby("id_producto", as_index=False)["cantidad_disponible"].sum()
+    vista = (
+        base.merge(lineas, on="id_pedido", how="left")
+        .merge(modelo["productos"], on="id_producto", how="left")
+        .merge(inventario, on="id_producto", how="left")
+        .merge(modelo["facturas"], on="id_pedido", how="left")
+    )
+    return vista[COLUMNAS_DETALLE]
+
+
+def bloques_detalle(modelo, pedidos, lineas, filas=CHUNK_FILAS):
+    """Vista de detalle de ``pedidos`` armada de a ``filas`` pedidos, para exportarla sin unirla entera."""
+    if pedidos.empty:
+        yield vista_detalle(modelo, pedidos, lineas)
+        return
+    for inicio in range(0, len(pedidos), filas):
+        bloque = pedidos.iloc[inicio:inicio + filas]
+        yield vista_detalle(modelo, bloque, lineas[lineas["id_pedido"].isin(bloque["id_pedido"])])
+
+
+# Resumen diario de ventas: una fila por (fecha, ciudad, producto, categoría).
+# El total de cada pedido se reparte entre sus líneas según el precio de cada
+# producto (en partes iguales si el pedido no suma precio), así que cualquier suma
+# sobre el resumen cuenta cada pedido una sola vez. El ``* 1.0`` evita la división
+# entera de SQLite cuando guarda un total o un precio como INTEGER.
+ROLLUP_CLAVES = ["fecha_pedido", "ciudad", "id_producto", "nombre_producto", "nombre_categoria"]
+ROLLUP_QUERY = """
+    SELECT
+        DATE(p.fecha_pedido) AS fecha_pedido, c.ciudad,
+        pr.id_producto, pr.nombre_producto, cat.nombre_categoria,
+        SUM(CASE
+            WHEN np.precio > 0 THEN p.total_pedido * 1.0 * COALESCE(pr.precio_producto, 0) / np.precio
+            ELSE p.total_pedido * 1.0 / COALESCE(np.lineas, 1)
+        END) AS total_pedido,
+        COUNT(*) AS lineas
+    FROM pedido p
+    JOIN cliente c ON c.id_cliente = p.id_cliente
+    LEFT JOIN (
+        SELECT npp.id_pedido, COUNT(*) AS lineas, SUM(npr.precio_producto) AS precio
+        FROM pedido_producto npp
+        LEFT JOIN producto npr ON npp.id_producto = npr.id_producto
+        WHERE npp.id_pedido > :desde AND npp.id_pedido <= :hasta
+        GROUP BY npp.id_pedido
+    ) np ON np.id_pedido = p.id_pedido
+    LEFT JOIN pedido_producto pp ON p.id_pedido = pp.id_pedido
+    LEFT JOIN producto pr ON pp.id_producto = pr.id_producto
+    LEFT JOIN categoria cat ON pr.id_categoria = cat.id_categoria
+    WHERE p.id_pedido > :desde AND p.id_pedido <= :hasta
+    GROUP BY DATE(p.fecha_pedido), c.ciudad, pr.id_producto, pr.nombre_producto, cat.nombre_categoria
+"""
+
+def leer_rollup(conn, desde):
+    """Agrega los pedidos con ``id_pedido`` mayor a ``desde``; devuelve el bloque y la nueva marca de agua."""
+    hasta = conn.execute(text("SELECT COALESCE(MAX(id_pedido), 0) FROM pedido")).scalar()
+    result = conn.execute(text(ROLLUP_QUERY), {"desde": desde, "hasta": hasta})
+    nuevos = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    nuevos["fecha_pedido"] = pd.to_datetime(nuevos["fecha_pedido"])
+    nuevos["total_pedido"] = pd.to_numeric(nuevos["total_pedido"])
+    return nuevos, hasta
+
+
+def combinar_rollup(actual, nuevos):
+    """Suma un bloque incremental al resumen existente, fila a fila por clave."""
+    return (
+        pd.concat([actual, nuevos], ignore_index=True)
+        .groupby(ROLLUP_CLAVES, dropna=False, as_index=False)[["total_pedido", "lineas"]]
+        .sum()
+    )
+
+
+# El resumen se guarda en el mismo directorio que el snapshot del modelo, con su
+# propio manifiesto: un proceso nuevo lo lee y solo agrega los pedidos posteriores
+# a su marca de agua, sin volver a correr ROLLUP_QUERY sobre todo el historial
+ROLLUP_MANIFIESTO = "rollup.json"
+
+
+def huella_rollup(origen):
+    """Identifica la base de origen y la consulta del resumen; un resumen guardado con otra huella no se usa."""
+    contenido = json.dumps([origen, ROLLUP_CLAVES, ROLLUP_QUERY])
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:16]
+
+
+def guardar_snapshot_rollup(directorio, rollup, marca_agua, huella, reconstruido_en=None):
+    """Escribe el resumen (``rollup.arrow``) y su manifiesto con la marca de agua."""
+    return guardar_snapshot(
+        directorio, {"rollup": rollup}, {"id_pedido": marca_agua}, huella, reconstruido_en, ROLLUP_MANIFIESTO
+    )
+
+
+def leer_snapshot_rollup(directorio, huella=None):
+    """Lee el resumen guardado y devuelve ``(rollup, manifiesto)``, o ``(None, None)`` si no hay uno válido."""
+    tablas, manifiesto = leer_snapshot(directorio, huella, {"rollup": None}, ROLLUP_MANIFIESTO)
+    return (tablas["rollup"], manifiesto) if tablas is not None else (None, None)
+
+
+def filtrar_rollup(rollup, ciudades, productos, categorias, fecha_inicio, fecha_fin, indice=None):
+    """Aplica los filtros del sidebar sobre el resumen diario (unos pocos miles de filas).
+
+    Con ``indice`` (de ``indexar_rollup``) se resuelve por posiciones, sin máscaras
+    intermedias del tamaño del resumen.
+    """
+    if indice is not None:
+        elegidos = {
+            dimension: valores
+            for dimension, valores in (("ciudades", ciudades), ("productos", productos), ("categorias", categorias))
+            if valores
+        }
+        posiciones = posiciones_filtradas(indice, elegidos, fecha_inicio, fecha_fin)
+        return rollup if posiciones is None else rollup.iloc[posiciones]
+    mascara = pd.Series(True, index=rollup.index)
+    if ciudades:
+        mascara &= rollup["ciudad"].isin(ciudades)
+    if productos:
+        mascara &= rollup["nombre_producto"].isin(productos)
+    if categorias:
+        mascara &= rollup["nombre_categoria"].isin(categorias)
+    if fecha_inicio and fecha_fin:
+        mascara &= rollup["fecha_pedido"].between(pd.Timestamp(fecha_inicio), pd.Timestamp(fecha_fin))
+    return rollup[mascara]
@@ -0,0 +1,327 @@
+"""Diagnóstico de los planes de consulta del dashboard de Asartialpaca.
+
+Pasa por ``EXPLAIN`` (``EXPLAIN QUERY PLAN`` en SQLite) cada consulta que lanza
+el dashboard: la carga del modelo tabla por tabla, los deltas de la
+sincronización incremental, los pedidos filtrados, el modelo filtrado en SQL
+(``ASARTI_FILTROS_SQL=1``), el resumen diario y cada reporte de ``REPORTES``
+con y sin filtros. Marca los recorridos completos de tabla, los ordenamientos
+sin índice (filesort), las tablas temporales y las uniones sin índice; mide
+cada consulta y sugiere los índices que faltan sobre las columnas de unión y
+de filtro de las tablas recorridas. También avisa de las uniones entre
+columnas de nombre distinto, que suelen ser claves mal elegidas. Los
+recorridos completos de la carga del modelo son esperables: leen cada tabla
+entera.
+
+Uso:
+    python asarti_diagnostico.py --url sqlite:///asarti_bench_1k.db
+    python asarti_diagnostico.py --url mysql+pymysql://root@localhost/asartialpaca --analizar --salida diagnostico.json
+    python asarti_diagnostico.py --comparar diagnostico.json
+
+Con ``--analizar`` (solo MySQL 8.0.18 o posterior) se guarda además la salida
+de ``EXPLAIN ANALYZE``, que ejecuta la consulta. Todas las consultas son de
+solo lectura.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import time
+from datetime import date, datetime
+
+import pandas as pd
+from sqlalchemy import create_engine, inspect, text
+
+from asarti_datos import (
+    MODELO_INCREMENTAL,
+    MODELO_QUERIES,
+    MODELO_FILTRADO,
+    ROLLUP_QUERY,
+    consultas_modelo_filtrado,
+    enlazar,
+    leer_marcas,
+    registrar_funciones_sqlite,
+    sql_pedidos_filtrados,
+)
+from asarti_reportes import REPORTES, sql_reporte
+
+# Problemas que se marcan en los planes
+ALERTAS = {
+    "escaneo": "recorre la tabla completa",
+    "escaneo_indice": "recorre un índice completo",
+    "union_sin_indice": "une sin índice",
+    "filesort": "ordena sin índice (filesort)",
+    "temporal": "usa una tabla temporal",
+}
+
+# Palabras que pueden seguir al nombre de una tabla y no son su alias
+PALABRAS_CLAVE = {
+    "ON", "WHERE", "JOIN", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS", "GROUP", "ORDER", "LIMIT", "USING", "HAVING",
+}
+
+REFERENCIA = r"(?:(\w+)\.)?(\w+)"
+
+
+def filtros_de_ejemplo(conn):
+    """Filtros de los reportes filtrados: ciudad, producto y categoría de la primera línea de pedido
+    (así la combinación devuelve filas) y el rango completo de fechas."""
+    linea = conn.execute(
+        text(
+            "SELECT c.ciudad, pr.nombre_producto, cat.nombre_categoria"
+            " FROM pedido_producto pp"
+            " JOIN pedido p ON p.id_pedido = pp.id_pedido"
+            " JOIN cliente c ON c.id_cliente = p.id_cliente"
+            " JOIN producto pr ON pr.id_producto = pp.id_producto"
+            " LEFT JOIN categoria cat ON cat.id_categoria = pr.id_categoria"
+            " ORDER BY pp.id_pedido LIMIT 1"
+        )
+    ).mappings().first() or {}
+    rango = conn.execute(text("SELECT MIN(fecha_pedido) AS desde, MAX(fecha_pedido) AS hasta FROM pedido")).mappings().one()
+    return {
+        "ciudades": [linea["ciudad"]] if linea.get("ciudad") else [],
+        "productos": [linea["nombre_producto"]] if linea.get("nombre_producto") else [],
+        "categorias": [linea["nombre_categoria"]] if linea.get("nombre_categoria") else [],
+        "fecha_inicio": date.fromisoformat(str(rango["desde"])[:10]) if rango["desde"] else None,
+        "fecha_fin": date.fromisoformat(str(rango["hasta"])[:10]) if rango["hasta"] else None,
+    }
+
+
+def consultas_dashboard(conn, filtros):
+    """Todas las consultas del dashboard como ``{nombre: (sql, parámetros)}``."""
+    consultas = {f"modelo:{nombre}": (query, {}) for nombre, query in MODELO_QUERIES.items()}
+    marcas = leer_marcas(conn)
+    for nombre, (marca, condicion) in MODELO_INCREMENTAL.items():
+        if marcas.get(marca) is not None:
+            consultas[f"delta:{nombre}"] = (f"{MODELO_QUERIES[nombre]} WHERE {condicion}", {"marca": marcas[marca]})
+    consultas["pedidos_filtrados"] = sql_pedidos_filtrados(
+        filtros["ciudades"], filtros["productos"], filtros["categorias"], filtros["fecha_inicio"], filtros["fecha_fin"]
+    )
+    filtrado = consultas_modelo_filtrado(
+        filtros["ciudades"], filtros["productos"], filtros["categorias"], filtros["fecha_inicio"], filtros["fecha_fin"]
+    )
+    for nombre in MODELO_FILTRADO:
+        consultas[f"filtrado:{nombre}"] = filtrado[nombre]
+    consultas["rollup"] = (ROLLUP_QUERY, {"desde": 0, "hasta": marcas["id_pedido"] or 0})
+    for nombre in REPORTES:
+        query, params = sql_reporte(nombre)
+        consultas[f"reporte:{nombre}"] = (query.text, params)
+    for nombre in REPORTES:
+        query, params = sql_reporte(nombre, filtros)
+        consultas[f"reporte_filtrado:{nombre}"] = (query.text, params)
+    return consultas
+
+
+def plan_sqlite(conn, sql, params):
+    """Pasos de ``EXPLAIN QUERY PLAN`` con sus alertas."""
+    pasos = []
+    for fila in conn.execute(enlazar("EXPLAIN QUERY PLAN " + sql, params), params):
+        detalle = fila[-1]
+        paso = {"tabla": None, "detalle": detalle, "alertas": []}
+        acceso = re.match(r"(SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS (\w+))?", detalle)
+        if acceso and not detalle.startswith("SCAN CONSTANT ROW"):
+            paso["tabla"] = acceso.group(3) or acceso.group(2)
+            if acceso.group(1) == "SCAN":
+                paso["alertas"].append("escaneo_indice" if "INDEX" in detalle else "escaneo")
+        if "AUTOMATIC" in detalle:
+            paso["alertas"].append("union_sin_indice")
+        if "FOR ORDER BY" in detalle:
+            paso["alertas"].append("filesort")
+        if "FOR GROUP BY" in detalle or "FOR DISTINCT" in detalle:
+            paso["alertas"].append("temporal")
+        pasos.append(paso)
+    return pasos
+
+
+def plan_mysql(conn, sql, params):
+    """Filas de ``EXPLAIN`` con sus alertas (tipo de acceso y columna ``Extra``)."""
+    pasos = []
+    for fila in conn.execute(enlazar("EXPLAIN " + sql, params), params).mappings():
+        extra = fila["Extra"] or ""
+        paso = {
+            "tabla": fila["table"],
+            "detalle": f"{fila['type']} key={fila['key']} rows={fila['rows']} {extra}".strip(),
+            "alertas": [],
+        }
+        if fila["type"] == "ALL":
+            paso["alertas"].append("escaneo")
+        elif fila["type"] == "index":
+            paso["alertas"].append("escaneo_indice")
+        if "join buffer" in extra:
+            paso["alertas"].append("union_sin_indice")
+        if "filesort" in extra:
+            paso["alertas"].append("filesort")
+        if "temporary" in extra:
+            paso["alertas"].append("temporal")
+        pasos.append(paso)
+    return pasos
+
+
+def alias_de_tablas(sql):
+    """``{alias: tabla}`` de las tablas nombradas en ``FROM`` y ``JOIN`` (cada tabla es también su propio alias)."""
+    alias = {}
+    for tabla, nombre in re.findall(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, flags=re.IGNORECASE):
+        alias[tabla] = tabla
+        if nombre and nombre.upper() not in PALABRAS_CLAVE:
+            alias[nombre] = tabla
+    return alias
+
+
+def columnas_condicion(sql, alias, columnas):
+    """Pares ``(tabla, columna)`` que aparecen en condiciones de unión o de filtro.
+
+    Las columnas sin alias se atribuyen a todas las tablas de la consulta que
+    las tienen; ``columnas`` es ``{tabla: nombres de columnas}``.
+    """
+    referencias = re.findall(rf"{REFERENCIA}\s*(?:>=|<=|<>|!=|=|>|<)", sql)
+    referencias += re.findall(rf"(?:>=|<=|<>|!=|=|>|<)\s*{REFERENCIA}", sql)
+    referencias += re.findall(rf"{REFERENCIA}\s+(?:NOT\s+)?(?:IN|BETWEEN|LIKE)\b", sql, flags=re.IGNORECASE)
+    usadas = set()
+    for prefijo, columna in referencias:
+        if prefijo:
+            tablas = [alias[prefijo]] if prefijo in alias else []
+        else:
+            tablas = set(alias.values())
+        usadas.update((tabla, columna) for tabla in tablas if columna in columnas.get(tabla, ()))
+    return usadas
+
+
+def claves_sospechosas(sql, alias):
+    """Uniones entre columnas de nombre distinto (``a.x = b.y`` o ``x IN (SELECT y ...)``)."""
+    avisos = []
+    for a1, c1, a2, c2 in re.findall(rf"{REFERENCIA}\s*=\s*{REFERENCIA}", sql):
+        if a1 in alias and a2 in alias and c1 != c2:
+            avisos.append(f"{alias[a1]}.{c1} = {alias[a2]}.{c2}")
+    for a1, c1, a2, c2 in re.findall(rf"{REFERENCIA}\s+IN\s*\(\s*SELECT\s+{REFERENCIA}", sql, flags=re.IGNORECASE):
+        if c1 != c2:
+            avisos.append(f"{alias.get(a1, a1) + '.' if a1 else ''}{c1} IN (SELECT {alias.get(a2, a2) + '.' if a2 else ''}{c2})")
+    return avisos
+
+
+def esquema(engine):
+    """Columnas y primeras columnas indexadas (clave primaria incluida) de cada tabla."""
+    inspector = inspect(engine)
+    columnas = {}
+    indexadas = {}
+    for tabla in inspector.get_table_names():
+        columnas[tabla] = {columna["name"] for columna in inspector.get_columns(tabla)}
+        primeras = set(inspector.get_pk_constraint(tabla)["constrained_columns"][:1])
+        primeras.update(indice["column_names"][0] for indice in inspector.get_indexes(tabla) if indice["column_names"])
+        indexadas[tabla] = primeras
+    return columnas, indexadas
+
+
+def sugerir_indices(sql, pasos, columnas, indexadas):
+    """Índices sobre las columnas de condición de las tablas recorridas o unidas sin índice."""
+    alias = alias_de_tablas(sql)
+    usadas = columnas_condicion(sql, alias, columnas)
+    sugerencias = []
+    for paso in pasos:
+        if not {"escaneo", "union_sin_indice"} & set(paso["alertas"]) or paso["tabla"] not in alias:
+            continue
+        tabla = alias[paso["tabla"]]
+        for columna in sorted(columna for t, columna in usadas if t == tabla and columna not in indexadas.get(tabla, ())):
+            indice = f"CREATE INDEX ix_{tabla}_{columna} ON {tabla} ({columna})"
+            if indice not in sugerencias:
+                sugerencias.append(indice)
+    return sugerencias
+
+
+def diagnosticar(conn, sql, params, columnas, indexadas, repeticiones=1, analizar=False):
+    """Plan, alertas, latencia y sugerencias de una consulta."""
+    mysql = conn.dialect.name == "mysql"
+    pasos = plan_mysql(conn, sql, params) if mysql else plan_sqlite(conn, sql, params)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        filas = len(conn.execute(enlazar(sql, params), params).fetchall())
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    resultado = {
+        "ms": statistics.median(tiempos),
+        "filas": filas,
+        "alertas": sorted({alerta for paso in pasos for alerta in paso["alertas"]}),
+        "plan": pasos,
+        "claves_sospechosas": claves_sospechosas(sql, alias_de_tablas(sql)),
+        "indices_sugeridos": sugerir_indices(sql, pasos, columnas, indexadas),
+    }
+    if analizar and mysql:
+        resultado["explain_analyze"] = conn.execute(enlazar("EXPLAIN ANALYZE " + sql, params), params).scalar()
+    return resultado
+
+
+def imprimir(resultados, base=None):
+    """Tabla por consulta, avisos y sugerencias; con ``base`` agrega la variación de la latencia y de las alertas."""
+    filas = []
+    for nombre, consulta in resultados["consultas"].items():
+        fila = {"consulta": nombre, "ms": consulta["ms"], "filas": consulta["filas"], "alertas": ", ".join(consulta["alertas"])}
+        anterior = (base or {}).get("consultas", {}).get(nombre)
+        if anterior:
+            fila["vs_base_%"] = (consulta["ms"] / anterior["ms"] - 1) * 100 if anterior["ms"] else None
+            nuevas = set(consulta["alertas"]) - set(anterior["alertas"])
+            resueltas = set(anterior["alertas"]) - set(consulta["alertas"])
+            fila["cambios"] = " ".join([f"+{a}" for a in sorted(nuevas)] + [f"-{a}" for a in sorted(resueltas)])
+        filas.append(fila)
+    with pd.option_context("display.max_rows", None, "display.width", 200, "display.float_format", "{:,.2f}".format):
+        print(pd.DataFrame(filas).to_string(index=False))
+
+    sospechosas = sorted({clave for consulta in resultados["consultas"].values() for clave in consulta["claves_sospechosas"]})
+    if sospechosas:
+        print("\nUniones entre columnas de nombre distinto:")
+        for clave in sospechosas:
+            print(f"  {clave}")
+    print("\nÍndices sugeridos:" if resultados["indices_sugeridos"] else "\nSin índices sugeridos.")
+    for indice, consultas in resultados["indices_sugeridos"].items():
+        print(f"  {indice};  -- {len(consultas)} consulta(s): {', '.join(consultas)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("ASARTI_DB_URL", "mysql+pymysql://root@localhost/asartialpaca"))
+    parser.add_argument("--analizar", action="store_true", help="guardar también EXPLAIN ANALYZE (solo MySQL; ejecuta cada consulta)")
+    parser.add_argument("--repeticiones", type=int, default=1, help="ejecuciones por consulta para medir la latencia")
+    parser.add_argument("--consultas", nargs="+", metavar="TEXTO", help="solo las consultas cuyo nombre contiene alguno de estos textos")
+    parser.add_argument("--salida", help="archivo JSON donde guardar el diagnóstico")
+    parser.add_argument("--comparar", help="JSON de un diagnóstico anterior para comparar")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    if engine.dialect.name == "sqlite":
+        registrar_funciones_sqlite(engine)
+    if args.analizar and engine.dialect.name != "mysql":
+        print(f"--analizar solo está disponible en MySQL; en {engine.dialect.name} se usa solo el plan.")
+    columnas, indexadas = esquema(engine)
+
+    resultados = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "motor": engine.dialect.name,
+        "url": engine.url.render_as_string(hide_password=True),
+        "repeticiones": args.repeticiones,
+        "consultas": {},
+        "indices_sugeridos": {},
+    }
+    with engine.connect() as conn:
+        resultados["filtros"] = filtros = filtros_de_ejemplo(conn)
+        for nombre, (sql, params) in consultas_dashboard(conn, filtros).items():
+            if args.consultas and not any(texto in nombre for texto in args.consultas):
+                continue
+            resultados["consultas"][nombre] = diagnosticar(
+                conn, sql, params, columnas, indexadas, args.repeticiones, args.analizar
+            )
+    engine.dispose()
+    for nombre, consulta in resultados["consultas"].items():
+        for indice in consulta["indices_sugeridos"]:
+            resultados["indices_sugeridos"].setdefault(indice, []).append(nombre)
+
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            base = json.load(archivo)
+    imprimir(resultados, base)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, ensure_ascii=False, indent=2, default=str)
+        print(f"Diagnóstico guardado en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
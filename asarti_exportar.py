@@ -0,0 +1,147 @@
+"""Exportación por bloques de los datos filtrados y de los reportes.
+
+No depende de Streamlit. Los bloques se escriben comprimidos a medida que
+llegan, así nunca se arma el archivo completo junto con el DataFrame completo:
+CSV con gzip, Parquet con zstd (un row group por bloque) y XLSX con openpyxl en
+modo de solo escritura. ``exportar`` escribe en un archivo temporal que pasa a
+disco cuando supera ``EXPORTAR_MEMORIA_MB`` y devuelve los bytes comprimidos,
+que es lo que acepta ``st.download_button``.
+"""
+import gzip
+import io
+import os
+import tempfile
+from decimal import Decimal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from asarti_datos import CHUNK_FILAS
+
+# Tamaño del archivo de exportación que se mantiene en memoria antes de pasarlo a disco
+EXPORTAR_MEMORIA_MB = int(os.getenv("ASARTI_EXPORTAR_MEMORIA_MB", "16"))
+
+# Filas de datos por hoja de Excel (el límite del formato es 1.048.576 con el encabezado)
+FILAS_POR_HOJA = 1_048_575
+
+
+def bloques_dataframe(datos, filas=CHUNK_FILAS):
+    """Recorre un DataFrame ya cargado de a ``filas`` filas, sin copiarlo."""
+    if datos.empty:
+        yield datos
+        return
+    for inicio in range(0, len(datos), filas):
+        yield datos.iloc[inicio:inicio + filas]
+
+
+def escribir_csv(bloques, destino):
+    """CSV en UTF-8 comprimido con gzip; el encabezado sale del primer bloque."""
+    filas = 0
+    with gzip.GzipFile(fileobj=destino, mode="wb", compresslevel=6) as comprimido:
+        with io.TextIOWrapper(comprimido, encoding="utf-8", newline="") as texto:
+            for numero, bloque in enumerate(bloques):
+                bloque.to_csv(texto, index=False, header=numero == 0)
+                filas += len(bloque)
+    return filas
+
+
+def decimales_a_float(bloque):
+    """Pasa a float64 las columnas de ``Decimal`` (DECIMAL y SUM de MySQL), como ``tipar_bloque`` en el modelo.
+
+    Arrow deduce de cada bloque un ``decimal128`` con la precisión de sus valores,
+    así que un bloque posterior con más dígitos no entraría en el esquema del primero.
+    """
+    decimales = [
+        columna for columna in bloque.columns
+        if bloque[columna].dtype == object
+        and isinstance(next(iter(bloque[columna].dropna()), None), Decimal)
+    ]
+    return bloque.astype(dict.fromkeys(decimales, "float64")) if decimales else bloque
+
+
+def escribir_parquet(bloques, destino):
+    """Parquet comprimido con zstd; el esquema sale del primer bloque."""
+    filas = 0
+    escritor = None
+    try:
+        for bloque in bloques:
+            tabla = pa.Table.from_pandas(
+                decimales_a_float(bloque), schema=escritor.schema if escritor else None, preserve_index=False
+            )
+            if escritor is None:
+                escritor = pq.ParquetWriter(destino, tabla.schema, compression="zstd")
+            escritor.write_table(tabla)
+            filas += len(bloque)
+    finally:
+        if escritor is not None:
+            escritor.close()
+    return filas
+
+
+def escribir_xlsx(bloques, destino):
+    """Libro de Excel escrito fila a fila; se abre otra hoja al llegar al límite de filas."""
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    encabezado = None
+    hoja = None
+    filas = 0
+    for bloque in bloques:
+        if encabezado is None:
+            encabezado = [str(columna) for columna in bloque.columns]
+        # openpyxl no entiende los nulos de pandas ni las categorías
+        valores = bloque.astype(object).where(bloque.notna(), None)
+        for fila in valores.itertuples(index=False, name=None):
+            if filas % FILAS_POR_HOJA == 0:
+                hoja = libro.create_sheet(f"Datos {filas // FILAS_POR_HOJA + 1}")
+                hoja.append(encabezado)
+            hoja.append(fila)
+            filas += 1
+    if hoja is None:
+        libro.create_sheet("Datos 1").append(encabezado or [])
+    libro.save(destino)
+    return filas
+
+
+FORMATOS_EXPORTACION = {
+    "csv": {
+        "etiqueta": "CSV (gzip)",
+        "extension": "csv.gz",
+        "mime": "application/gzip",
+        "escribir": escribir_csv,
+    },
+    "parquet": {
+        "etiqueta": "Parquet",
+        "extension": "parquet",
+        "mime": "application/vnd.apache.parquet",
+        "escribir": escribir_parquet,
+    },
+    "xlsx": {
+        "etiqueta": "Excel",
+        "extension": "xlsx",
+        "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "escribir": escribir_xlsx,
+    },
+}
+
+
+def nombre_archivo(nombre, formato):
+    """Nombre de descarga para ``nombre`` en el formato dado."""
+    return f"{nombre.replace(' ', '_')}.{FORMATOS_EXPORTACION[formato]['extension']}"
+
+
+def escribir_exportacion(bloques, formato, destino):
+    """Escribe los bloques en ``destino`` (archivo binario abierto) y devuelve la cantidad de filas."""
+    return FORMATOS_EXPORTACION[formato]["escribir"](bloques, destino)
+
+
+def exportar(bloques, formato):
+    """Escribe los bloques en un archivo temporal y devuelve el archivo terminado como ``bytes``.
+
+    Streamlit no acepta ``SpooledTemporaryFile`` como resultado de una descarga
+    diferida, así que se entrega el contenido ya comprimido.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=EXPORTAR_MEMORIA_MB * 2**20) as destino:
+        escribir_exportacion(bloques, formato, destino)
+        destino.seek(0)
+        return destino.read()
@@ -0,0 +1,577 @@
+"""Registro de reportes del dashboard de Asartialpaca.
+
+Cada reporte declara su consulta, sus parámetros, las columnas por las que se
+le aplican los filtros del sidebar, un post-proceso opcional del resultado y la
+especificación de su gráfico. ``Asarti.py`` ejecuta solo los
+reportes de la pestaña abierta; este módulo no depende de Streamlit y también
+se puede usar desde la línea de comandos:
+
+    python asarti_reportes.py --listar
+    python asarti_reportes.py --url sqlite:///asarti_bench_1k.db --seccion Promociones --salida reportes/ --html
+    python asarti_reportes.py --ciudades "La Paz" Oruro --desde 2024-01-01 --hasta 2024-06-30
+    python asarti_reportes.py --salida exportes/ --formato parquet
+"""
+import argparse
+import os
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from sqlalchemy import create_engine
+
+from asarti_datos import enlazar, leer_bloques, registrar_funciones_sqlite, sql_pedidos_filtrados
+from asarti_exportar import FORMATOS_EXPORTACION, escribir_exportacion, nombre_archivo
+
+# Gráficos: series máximas por gráfico y umbral de puntos para WebGL
+TOP_N_SERIES = int(os.getenv("ASARTI_TOP_N_SERIES", "15"))
+UMBRAL_WEBGL = int(os.getenv("ASARTI_UMBRAL_WEBGL", "1000"))
+
+# Estilo común de los gráficos de reportes
+ESTILO_REPORTES = dict(
+    title_x=0.5,
+    title_font_color="#005F5B",
+    plot_bgcolor="#4B0000",  # Fondo del gráfico
+    paper_bgcolor="#4B0000",  # Fondo del área del gráfico
+)
+
+
+def agrupar_otros(datos, columna, valor, agregacion="sum", top_n=None):
+    """Deja las ``top_n`` filas con mayor ``valor`` y junta el resto en una sola fila "Otros".
+
+    Así un gráfico con cientos de productos o clientes sigue teniendo a lo sumo
+    ``top_n + 1`` barras, porciones o trazas.
+    """
+    top_n = TOP_N_SERIES if top_n is None else top_n
+    if len(datos) <= top_n + 1:
+        return datos
+    ordenados = datos.sort_values(valor, ascending=False)
+    principales = ordenados.head(top_n)[[columna, valor]].copy()
+    principales[columna] = principales[columna].astype(object)
+    otros = pd.DataFrame({columna: ["Otros"], valor: [ordenados[valor].iloc[top_n:].agg(agregacion)]})
+    return pd.concat([principales, otros], ignore_index=True)
+
+
+def serie_top(datos, columna, valor, top_n=None):
+    """Etiqueta para colorear: el valor de ``columna`` si está entre los ``top_n`` mayores, si no "Otros".
+
+    A diferencia de ``agrupar_otros`` se conservan todos los puntos; solo se
+    limita la cantidad de trazas (una por color).
+    """
+    top_n = TOP_N_SERIES if top_n is None else top_n
+    principales = datos.sort_values(valor, ascending=False)[columna].head(top_n)
+    return datos[columna].astype(object).where(datos[columna].isin(principales), "Otros")
+
+
+def modo_dispersion(datos):
+    """Usa WebGL para los gráficos de dispersión con muchos puntos."""
+    return "webgl" if len(datos) > UMBRAL_WEBGL else "auto"
+
+
+def calcular_tendencia(valores):
+    """Recta de mínimos cuadrados sobre la serie completa (x = posición de cada punto).
+
+    Reemplaza ``trendline="ols"`` de Plotly, que importa statsmodels y ajusta un
+    modelo por cada grupo de color en cada rerun.
+    """
+    y = pd.to_numeric(valores, errors="coerce").to_numpy(dtype="float64")
+    x = np.arange(len(y), dtype="float64")
+    validos = ~np.isnan(y)
+    if validos.sum() < 2:
+        return None
+    diseno = np.column_stack([x[validos], np.ones(validos.sum())])
+    (pendiente, intercepto), *_ = np.linalg.lstsq(diseno, y[validos], rcond=None)
+    return pendiente * x + intercepto
+
+
+def columnas_numericas(*columnas):
+    """Post-proceso que convierte las columnas dadas a número (los DECIMAL llegan como objetos)."""
+    def convertir(datos):
+        return datos.assign(**{columna: pd.to_numeric(datos[columna], errors="coerce") for columna in columnas})
+    return convertir
+
+
+def reporte(seccion, sql, grafico, params=None, postproceso=None, filtros=None):
+    """Declara un reporte del registro.
+
+    ``sql`` lleva ``{where}`` donde van las condiciones de los filtros activos.
+    ``filtros`` indica qué columna de la consulta identifica el ``pedido``, el
+    ``producto`` o el ``cliente``; cada una se restringe con ``IN (subconsulta)``
+    a los que cumplen los filtros del sidebar. Un reporte sin ``filtros`` no
+    cambia al filtrar.
+
+    ``grafico`` describe la figura: ``tipo`` es la función de ``plotly.express``
+    y ``args`` sus argumentos; ``agrupar`` (columna, valor) junta las filas
+    menores en "Otros", ``serie`` (columna, valor) agrega la columna ``serie``
+    para colorear solo las principales, ``dispersion`` activa WebGL con muchos
+    puntos, ``tendencia`` (x, y) agrega la recta de mínimos cuadrados y
+    ``trazas`` / ``layout`` se pasan a ``update_traces`` / ``update_layout``.
+    """
+    return {
+        "seccion": seccion,
+        "sql": sql,
+        "params": params or {},
+        "postproceso": postproceso,
+        "filtros": filtros or {},
+        "grafico": grafico,
+    }
+
+
+# Registro de reportes, en el orden en que se muestran dentro de cada sección
+REPORTES = {
+    "Ventas Totales por Cliente": reporte(
+        "Ventas",
+        """
+        SELECT c.nombre_cliente, CONCAT(c.nombre_cliente, ' ', c.apellido_cliente) AS cliente,
+               SUM(p.total_pedido) AS total_compras
+        FROM cliente AS c
+        JOIN pedido AS p ON c.id_cliente = p.id_cliente
+        {where}
+        GROUP BY c.id_cliente
+        ORDER BY total_compras DESC;
+        """,
+        # Mapa de Calor
+        {
+            "tipo": "density_heatmap",
+            "agrupar": ("cliente", "total_compras"),
+            "args": dict(
+                x="cliente",
+                y="total_compras",
+                z="total_compras",
+                title="Mapa de Calor: Ventas Totales por Cliente",
+                color_continuous_scale="Spectral",
+            ),
+            "layout": dict(font=dict(color="white")),  # Asegura que el texto sea visible en el fondo oscuro
+        },
+        filtros={"pedido": "p.id_pedido"},
+    ),
+    "Cantidad de Productos Vendidos por Categoría": reporte(
+        "Ventas",
+        """
+        SELECT cat.nombre_categoria, SUM(dp.cantidad_producto) AS total_vendidos
+        FROM categoria AS cat
+        JOIN producto AS prod ON cat.id_categoria = prod.id_categoria
+        JOIN detalle_pedido AS dp ON prod.id_producto = dp.id_cliente_pedido
+        {where}
+        GROUP BY cat.id_categoria
+        ORDER BY total_vendidos DESC;
+        """,
+        # Gráfico de Barras
+        {
+            "tipo": "bar",
+            "agrupar": ("nombre_categoria", "total_vendidos"),
+            "args": dict(
+                x="nombre_categoria",
+                y="total_vendidos",
+                title="Gráfico de Barras: Productos Vendidos por Categoría",
+                text_auto=True,
+                color="nombre_categoria",
+                color_discrete_sequence=px.colors.qualitative.Dark2,
+            ),
+        },
+        filtros={"producto": "prod.id_producto"},
+    ),
+    "Descuento Promedio en Promociones": reporte(
+        "Promociones",
+        """
+        SELECT nombre_promocion, AVG(porcentaje_descuento) AS descuento_promedio
+        FROM promocion
+        {where}
+        GROUP BY nombre_promocion
+        ORDER BY descuento_promedio DESC;
+        """,
+        # Gráfico de Dispersión con Línea de Tendencia
+        {
+            "tipo": "scatter",
+            "serie": ("nombre_promocion", "descuento_promedio"),
+            "dispersion": True,
+            "tendencia": ("nombre_promocion", "descuento_promedio"),
+            "args": dict(
+                x="nombre_promocion",
+                y="descuento_promedio",
+                title="Gráfico de Dispersión: Descuento Promedio",
+                color="serie",
+                color_discrete_sequence=px.colors.qualitative.Bold,
+            ),
+        },
+        filtros={"producto": "id_producto"},
+    ),
+    "Estado de Pedidos por Método de Pago": reporte(
+        "Pedidos y facturación",
+        """
+        SELECT metodo_pago, estado_final_pedido, COUNT(id_historial) AS total_pedidos
+        FROM historial
+        {where}
+        GROUP BY metodo_pago, estado_final_pedido
+        ORDER BY total_pedidos DESC;
+        """,
+        # Gráfico Circular (Sunburst)
+        {
+            "tipo": "sunburst",
+            "args": dict(
+                path=["metodo_pago", "estado_final_pedido"],
+                values="total_pedidos",
+                title="Sunburst: Estado de Pedidos por Método de Pago",
+                color="total_pedidos",
+                color_continuous_scale="Inferno",
+            ),
+        },
+    ),
+    "Monto Total Facturado por Mes": reporte(
+        "Pedidos y facturación",
+        """
+        SELECT DATE_FORMAT(fecha_emision, '%Y-%m') AS mes, SUM(monto_total) AS total_facturado
+        FROM facturacion
+        {where}
+        GROUP BY mes
+        ORDER BY mes DESC;
+        """,
+        # Gráfico de Área
+        {
+            "tipo": "area",
+            "args": dict(
+                x="mes",
+                y="total_facturado",
+                title="Gráfico de Área: Monto Total Facturado por Mes",
+                color_discrete_sequence=["#3E4B8D"],
+            ),
+        },
+        filtros={"pedido": "id_detalle_pedido"},
+    ),
+    "Promedio de Compra por Cliente": reporte(
+        "Ventas",
+        """
+        SELECT c.nombre_cliente, c.apellido_cliente, AVG(p.total_pedido) AS promedio_compra
+        FROM cliente c
+        JOIN pedido p ON c.id_cliente = p.id_cliente
+        {where}
+        GROUP BY c.id_cliente
+        ORDER BY promedio_compra DESC;
+        """,
+        # Gráfico de Burbuja
+        {
+            "tipo": "scatter",
+            "serie": ("nombre_cliente", "promedio_compra"),
+            "dispersion": True,
+            "args": dict(
+                x="nombre_cliente",
+                y="promedio_compra",
+                size="promedio_compra",
+                color="serie",
+                title="Gráfico de Burbuja: Promedio de Compra por Cliente",
+                color_discrete_sequence=px.colors.qualitative.Set1,
+            ),
+            "trazas": dict(marker=dict(opacity=1)),
+        },
+        # Convertir tamaño a numérico
+        postproceso=columnas_numericas("promedio_compra"),
+        filtros={"pedido": "p.id_pedido"},
+    ),
+    "Productos más Vendidos": reporte(
+        "Ventas",
+        """
+        SELECT p.nombre_producto, SUM(dp.cantidad_producto) AS total_vendido
+        FROM pedido_producto pp
+        JOIN producto p ON pp.id_producto = p.id_producto
+        JOIN detalle_pedido dp ON dp.id_cliente_pedido = pp.id_pedido
+        {where}
+        GROUP BY p.nombre_producto
+        ORDER BY total_vendido DESC;
+        """,
+        # Gráfico de Barras Apiladas
+        {
+            "tipo": "bar",
+            "agrupar": ("nombre_producto", "total_vendido"),
+            "args": dict(
+                x="nombre_producto",
+                y="total_vendido",
+                color="nombre_producto",
+                title="Gráfico de Barras Apiladas: Productos Más Vendidos",
+                text_auto=True,
+                color_discrete_sequence=px.colors.qualitative.Vivid,
+            ),
+        },
+        filtros={"pedido": "pp.id_pedido", "producto": "p.id_producto"},
+    ),
+    "Empleados por Cargo": reporte(
+        "Operación",
+        """
+        SELECT ce.nombre_cargo, COUNT(e.id_empleado) AS total_empleados
+        FROM cargo_empleado ce
+        JOIN empleado e ON ce.id_cargo_empleado = e.id_cargo_empleado
+        {where}
+        GROUP BY ce.id_cargo_empleado
+        ORDER BY total_empleados DESC;
+        """,
+        # Gráfico Circular
+        {
+            "tipo": "pie",
+            "agrupar": ("nombre_cargo", "total_empleados"),
+            "args": dict(
+                names="nombre_cargo",
+                values="total_empleados",
+                title="Gráfico Circular: Empleados por Cargo",
+                color_discrete_sequence=px.colors.qualitative.Dark24,
+            ),
+        },
+    ),
+    "Historial de Estados de Carritos de Compras": reporte(
+        "Operación",
+        """
+        SELECT estado_carrito, COUNT(id_carrito_compras) AS total_carritos
+        FROM carrito_compras
+        {where}
+        GROUP BY estado_carrito
+        ORDER BY total_carritos DESC;
+        """,
+        # Histograma
+        {
+            "tipo": "histogram",
+            "agrupar": ("estado_carrito", "total_carritos"),
+            "args": dict(
+                x="estado_carrito",
+                y="total_carritos",
+                title="Histograma: Estados de Carritos de Compras",
+                color="estado_carrito",
+                color_discrete_sequence=px.colors.sequential.Plasma,
+            ),
+        },
+    ),
+    "Ingresos Generados por Promociones": reporte(
+        "Promociones",
+        """
+        SELECT p.nombre_promocion, SUM(p.porcentaje_descuento * dp.cantidad_producto * pr.precio_producto / 100) AS ingresos_promocion
+        FROM promocion AS p
+        JOIN producto AS pr ON p.id_producto = pr.id_producto
+        JOIN pedido_producto AS pp ON pr.id_producto = pp.id_producto
+        JOIN detalle_pedido AS dp ON pp.id_pedido = dp.id_cliente_pedido
+        {where}
+        GROUP BY p.id_promocion
+        ORDER BY ingresos_promocion DESC;
+        """,
+        # Box Plot
+        {
+            "tipo": "box",
+            "serie": ("nombre_promocion", "ingresos_promocion"),
+            "args": dict(
+                x="serie",
+                y="ingresos_promocion",
+                title="Gráfico Box Plot: Ingresos Generados por Promociones",
+                color="serie",
+                color_discrete_sequence=px.colors.qualitative.Pastel,
+            ),
+        },
+        filtros={"pedido": "pp.id_pedido", "producto": "pr.id_producto"},
+    ),
+}
+
+# Secciones en orden de primera aparición (una pestaña por sección en el dashboard)
+SECCIONES = list(dict.fromkeys(definicion["seccion"] for definicion in REPORTES.values()))
+
+
+def reportes_de_seccion(seccion):
+    """Nombres de los reportes de una sección, en el orden del registro."""
+    return [nombre for nombre, definicion in REPORTES.items() if definicion["seccion"] == seccion]
+
+
+# Filtros del sidebar que restringen cada entidad
+FILTROS_POR_ENTIDAD = {
+    "pedido": ("ciudades", "productos", "categorias", "fecha_inicio", "fecha_fin"),
+    "producto": ("productos", "categorias"),
+    "cliente": ("ciudades",),
+}
+
+
+def normalizar_filtros(nombre, filtros):
+    """Tupla ordenada con solo los filtros activos que afectan al reporte.
+
+    Dos estados del sidebar que dan el mismo resultado (otro orden en una
+    selección, o un filtro que el reporte no usa) dan la misma tupla, que es
+    la que se usa como clave de la caché de resultados.
+    """
+    filtros = filtros or {}
+    claves = {clave for entidad in REPORTES[nombre]["filtros"] for clave in FILTROS_POR_ENTIDAD[entidad]}
+    if not (filtros.get("fecha_inicio") and filtros.get("fecha_fin")):
+        claves -= {"fecha_inicio", "fecha_fin"}
+    normalizados = []
+    for clave in sorted(claves):
+        valor = filtros.get(clave)
+        if isinstance(valor, (list, tuple, set)):
+            valor = tuple(sorted(valor))
+        if valor:
+            normalizados.append((clave, valor))
+    return tuple(normalizados)
+
+
+def sql_reporte(nombre, filtros=None):
+    """Consulta de un reporte con las condiciones de los filtros activos y sus parámetros."""
+    definicion = REPORTES[nombre]
+    activos = dict(normalizar_filtros(nombre, filtros))
+    condiciones = []
+    params = dict(definicion["params"])
+    for entidad, columna in definicion["filtros"].items():
+        if entidad == "pedido":
+            if not activos:
+                continue
+            subconsulta, params_pedido = sql_pedidos_filtrados(
+                activos.get("ciudades"),
+                activos.get("productos"),
+                activos.get("categorias"),
+                activos.get("fecha_inicio"),
+                activos.get("fecha_fin"),
+            )
+            params.update(params_pedido)
+        elif entidad == "producto":
+            seleccion = []
+            if activos.get("productos"):
+                seleccion.append("pr.nombre_producto IN :productos")
+                params["productos"] = list(activos["productos"])
+            if activos.get("categorias"):
+                seleccion.append("cat.nombre_categoria IN :categorias")
+                params["categorias"] = list(activos["categorias"])
+            if not seleccion:
+                continue
+            subconsulta = (
+                "SELECT pr.id_producto FROM producto pr"
+                " LEFT JOIN categoria cat ON pr.id_categoria = cat.id_categoria"
+                " WHERE " + " AND ".join(seleccion)
+            )
+        elif entidad == "cliente":
+            if not activos.get("ciudades"):
+                continue
+            subconsulta = "SELECT c.id_cliente FROM cliente c WHERE c.ciudad IN :ciudades"
+            params["ciudades"] = list(activos["ciudades"])
+        condiciones.append(f"{columna} IN ({subconsulta})")
+
+    where = "WHERE " + " AND ".join(condiciones) if condiciones else ""
+    return enlazar(definicion["sql"].replace("{where}", where), params), params
+
+
+def consultar_reporte(conn, nombre, filtros=None):
+    """Ejecuta un reporte con los filtros dados (claves ``ciudades``, ``productos``,
+    ``categorias``, ``fecha_inicio`` y ``fecha_fin``) y aplica su post-proceso."""
+    definicion = REPORTES[nombre]
+    query, params = sql_reporte(nombre, filtros)
+    result = conn.execute(query, params)
+    datos = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    if definicion["postproceso"] is not None:
+        datos = definicion["postproceso"](datos)
+    return datos
+
+
+def bloques_reporte(conn, nombre, filtros=None):
+    """Recorre un reporte por bloques directamente desde el cursor, para exportarlo.
+
+    El post-proceso se aplica a cada bloque: los de ``REPORTES`` trabajan fila a fila.
+    """
+    postproceso = REPORTES[nombre]["postproceso"]
+    query, params = sql_reporte(nombre, filtros)
+    for bloque in leer_bloques(conn, query, params):
+        yield bloque if postproceso is None else postproceso(bloque)
+
+
+def construir_figura(nombre, datos):
+    """Arma la figura de un reporte a partir de la especificación de su gráfico."""
+    grafico = REPORTES[nombre]["grafico"]
+    args = dict(grafico["args"])
+    figura_datos = datos
+    if "agrupar" in grafico:
+        figura_datos = agrupar_otros(figura_datos, *grafico["agrupar"])
+    if "serie" in grafico:
+        columna, valor = grafico["serie"]
+        figura_datos = figura_datos.assign(serie=serie_top(figura_datos, columna, valor))
+        args.setdefault("labels", {"serie": columna})
+    if grafico.get("dispersion"):
+        args["render_mode"] = modo_dispersion(figura_datos)
+    fig = getattr(px, grafico["tipo"])(figura_datos, **args)
+
+    if "tendencia" in grafico:
+        x, y = grafico["tendencia"]
+        tendencia = calcular_tendencia(datos[y])
+        if tendencia is not None:
+            fig.add_trace(go.Scatter(
+                x=datos[x],
+                y=tendencia,
+                mode="lines",
+                name="Tendencia",
+                line=dict(color="#E6D5BE", dash="dash")
+            ))
+            fig.update_xaxes(categoryorder="array", categoryarray=datos[x])
+    if "trazas" in grafico:
+        fig.update_traces(**grafico["trazas"])
+    fig.update_layout(**ESTILO_REPORTES, **grafico.get("layout", {}))
+    return fig
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("ASARTI_DB_URL", "mysql+pymysql://root@localhost/asartialpaca"))
+    parser.add_argument("--reportes", nargs="+", choices=list(REPORTES), metavar="REPORTE", help="por defecto, todos")
+    parser.add_argument("--seccion", choices=SECCIONES, help="solo los reportes de esta sección")
+    parser.add_argument("--salida", help="directorio donde guardar un CSV por reporte")
+    parser.add_argument("--html", action="store_true", help="guardar también la figura de cada reporte (requiere --salida)")
+    parser.add_argument(
+        "--formato",
+        choices=list(FORMATOS_EXPORTACION),
+        help="exportar cada reporte por bloques desde el cursor, comprimido (requiere --salida)",
+    )
+    parser.add_argument("--ciudades", nargs="+", default=[])
+    parser.add_argument("--productos", nargs="+", default=[])
+    parser.add_argument("--categorias", nargs="+", default=[])
+    parser.add_argument("--desde", type=date.fromisoformat, help="fecha de pedido inicial (AAAA-MM-DD)")
+    parser.add_argument("--hasta", type=date.fromisoformat, help="fecha de pedido final (AAAA-MM-DD)")
+    parser.add_argument("--listar", action="store_true", help="mostrar el registro y salir")
+    args = parser.parse_args()
+
+    if args.listar:
+        for seccion in SECCIONES:
+            print(seccion)
+            for nombre in reportes_de_seccion(seccion):
+                print(f"  {nombre} ({REPORTES[nombre]['grafico']['tipo']})")
+        return
+    if args.html and not args.salida:
+        parser.error("--html requiere --salida")
+    if args.formato and not args.salida:
+        parser.error("--formato requiere --salida")
+    if args.formato and args.html:
+        parser.error("--formato no se combina con --html")
+
+    if bool(args.desde) != bool(args.hasta):
+        parser.error("--desde y --hasta van juntos")
+
+    nombres = args.reportes or (reportes_de_seccion(args.seccion) if args.seccion else list(REPORTES))
+    filtros = {
+        "ciudades": args.ciudades,
+        "productos": args.productos,
+        "categorias": args.categorias,
+        "fecha_inicio": args.desde,
+        "fecha_fin": args.hasta,
+    }
+    engine = create_engine(args.url)
+    if engine.dialect.name == "sqlite":
+        registrar_funciones_sqlite(engine)
+    if args.salida:
+        os.makedirs(args.salida, exist_ok=True)
+
+    with engine.connect() as conn:
+        for nombre in nombres:
+            inicio = time.perf_counter()
+            if args.formato:
+                with open(os.path.join(args.salida, nombre_archivo(nombre, args.formato)), "wb") as archivo:
+                    filas = escribir_exportacion(bloques_reporte(conn, nombre, filtros), args.formato, archivo)
+                print(f"{nombre}: {filas:,} filas exportadas en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+                continue
+            datos = consultar_reporte(conn, nombre, filtros)
+            print(f"{nombre}: {len(datos):,} filas en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+            if args.salida:
+                base = os.path.join(args.salida, nombre)
+                datos.to_csv(f"{base}.csv", index=False)
+                if args.html and not datos.empty:
+                    construir_figura(nombre, datos).write_html(f"{base}.html", include_plotlyjs="cdn")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,534 @@
+"""Benchmark reproducible del dashboard de Asartialpaca.
+
+Genera un conjunto de datos sintético compatible con el esquema de
+``asartialpaca`` a distintas escalas, lo carga en una base local (SQLite por
+defecto o un MySQL local) y mide latencia y pico de memoria de cada etapa:
+carga del modelo, sincronización incremental sin cambios, escritura y lectura
+del snapshot local, filtros, resumen diario, indicadores y cada reporte de
+``REPORTES``.
+
+Uso:
+    python benchmark.py --escalas 1 10 --salida base.json
+    python benchmark.py --escalas 1 10 --comparar base.json
+    python benchmark.py --url mysql+pymysql://root@localhost/asarti_bench --escalas 5
+
+La escala es la cantidad de pedidos en miles. Las tablas de la base indicada
+se borran y se vuelven a crear (salvo con ``--reutilizar``).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from asarti_datos import (
+    combinar_modelo,
+    filtrar_modelo,
+    filtrar_pedidos,
+    filtrar_rollup,
+    guardar_snapshot,
+    indexar_pedidos,
+    indexar_rollup,
+    leer_delta_modelo,
+    leer_marcas,
+    leer_modelo,
+    leer_modelo_filtrado,
+    leer_rollup,
+    leer_snapshot,
+    registrar_funciones_sqlite,
+    seleccionar_lineas,
+    vista_detalle,
+)
+from asarti_reportes import REPORTES, consultar_reporte
+
+# Base de producción: el benchmark se niega a borrar sus tablas
+BASE_PROTEGIDA = "asartialpaca"
+
+ESQUEMA = {
+    "categoria": """
+        CREATE TABLE categoria (
+            id_categoria INTEGER PRIMARY KEY,
+            nombre_categoria VARCHAR(60)
+        )
+    """,
+    "producto": """
+        CREATE TABLE producto (
+            id_producto INTEGER PRIMARY KEY,
+            nombre_producto VARCHAR(80),
+            precio_producto DECIMAL(12, 2),
+            id_categoria INTEGER
+        )
+    """,
+    "cliente": """
+        CREATE TABLE cliente (
+            id_cliente INTEGER PRIMARY KEY,
+            nombre_cliente VARCHAR(60),
+            apellido_cliente VARCHAR(60),
+            ciudad VARCHAR(40),
+            fecha_registro DATETIME
+        )
+    """,
+    "pedido": """
+        CREATE TABLE pedido (
+            id_pedido INTEGER PRIMARY KEY,
+            id_cliente INTEGER,
+            fecha_pedido DATETIME,
+            total_pedido DECIMAL(12, 2),
+            direccion_envio VARCHAR(120)
+        )
+    """,
+    "pedido_producto": """
+        CREATE TABLE pedido_producto (
+            id_pedido INTEGER,
+            id_producto INTEGER
+        )
+    """,
+    "inventario": """
+        CREATE TABLE inventario (
+            id_inventario INTEGER PRIMARY KEY,
+            id_producto INTEGER,
+            cantidad_disponible INTEGER,
+            id_ubicacion_almacen INTEGER
+        )
+    """,
+    "facturacion": """
+        CREATE TABLE facturacion (
+            id_facturacion INTEGER PRIMARY KEY,
+            id_detalle_pedido INTEGER,
+            monto_total DECIMAL(12, 2),
+            fecha_emision DATETIME,
+            razon_social VARCHAR(80)
+        )
+    """,
+    "detalle_pedido": """
+        CREATE TABLE detalle_pedido (
+            id_detalle_pedido INTEGER PRIMARY KEY,
+            id_cliente_pedido INTEGER,
+            cantidad_producto INTEGER
+        )
+    """,
+    "promocion": """
+        CREATE TABLE promocion (
+            id_promocion INTEGER PRIMARY KEY,
+            nombre_promocion VARCHAR(60),
+            porcentaje_descuento DECIMAL(5, 2),
+            id_producto INTEGER
+        )
+    """,
+    "historial": """
+        CREATE TABLE historial (
+            id_historial INTEGER PRIMARY KEY,
+            id_pedido INTEGER,
+            metodo_pago VARCHAR(30),
+            estado_final_pedido VARCHAR(30)
+        )
+    """,
+    "cargo_empleado": """
+        CREATE TABLE cargo_empleado (
+            id_cargo_empleado INTEGER PRIMARY KEY,
+            nombre_cargo VARCHAR(60)
+        )
+    """,
+    "empleado": """
+        CREATE TABLE empleado (
+            id_empleado INTEGER PRIMARY KEY,
+            nombre_empleado VARCHAR(60),
+            id_cargo_empleado INTEGER
+        )
+    """,
+    "carrito_compras": """
+        CREATE TABLE carrito_compras (
+            id_carrito_compras INTEGER PRIMARY KEY,
+            id_cliente INTEGER,
+            estado_carrito VARCHAR(30)
+        )
+    """,
+}
+
+# Índices sobre las claves foráneas (InnoDB los crea solo al declarar la FK)
+INDICES = [
+    "CREATE INDEX ix_producto_categoria ON producto (id_categoria)",
+    "CREATE INDEX ix_pedido_cliente ON pedido (id_cliente)",
+    "CREATE INDEX ix_pedido_producto_pedido ON pedido_producto (id_pedido)",
+    "CREATE INDEX ix_pedido_producto_producto ON pedido_producto (id_producto)",
+    "CREATE INDEX ix_inventario_producto ON inventario (id_producto)",
+    "CREATE INDEX ix_facturacion_detalle ON facturacion (id_detalle_pedido)",
+    "CREATE INDEX ix_promocion_producto ON promocion (id_producto)",
+    "CREATE INDEX ix_empleado_cargo ON empleado (id_cargo_empleado)",
+]
+
+CIUDADES = ["La Paz", "El Alto", "Cochabamba", "Santa Cruz", "Oruro", "Potosí", "Sucre", "Tarija", "Trinidad", "Cobija"]
+CATEGORIAS = [
+    "Ponchos", "Chompas", "Chalinas", "Gorros", "Guantes", "Mantas",
+    "Bufandas", "Abrigos", "Medias", "Accesorios", "Hilos", "Tapices",
+]
+APELLIDOS = ["Mamani", "Quispe", "Condori", "Flores", "Choque", "Vargas", "Rojas", "Gutiérrez", "López", "Torrez"]
+METODOS_PAGO = ["Efectivo", "Tarjeta", "QR", "Transferencia"]
+ESTADOS_PEDIDO = ["Entregado", "En camino", "Cancelado", "Devuelto"]
+ESTADOS_CARRITO = ["activo", "abandonado", "pagado", "expirado"]
+CARGOS = ["Ventas", "Almacén", "Tejido", "Diseño", "Logística", "Administración"]
+RAZONES_SOCIALES = ["Particular", "Alpaca Tours SRL", "Textiles Andinos SA", "Comercial Illimani"]
+
+
+def fechas_aleatorias(rng, n, inicio, fin):
+    """``n`` fechas con hora, uniformes entre ``inicio`` y ``fin``."""
+    inicio, fin = pd.Timestamp(inicio), pd.Timestamp(fin)
+    segundos = rng.integers(0, int((fin - inicio).total_seconds()), size=n)
+    return inicio + pd.to_timedelta(segundos, unit="s")
+
+
+def generar_datos(escala, semilla=42):
+    """Arma un DataFrame por tabla; ``escala`` es la cantidad de pedidos en miles.
+
+    Las ciudades y los clientes siguen una distribución sesgada (unos pocos
+    concentran la mayoría de los pedidos) y los ``id_pedido`` crecen con la
+    fecha, como en la base real.
+    """
+    rng = np.random.default_rng(semilla)
+    n_pedidos = int(1000 * escala)
+    n_clientes = max(50, n_pedidos // 5)
+    n_productos = min(5000, 50 + int(20 * escala))
+
+    pesos_ciudad = 1 / np.arange(1, len(CIUDADES) + 1)
+    clientes = pd.DataFrame({
+        "id_cliente": np.arange(1, n_clientes + 1),
+        "nombre_cliente": [f"Cliente{i}" for i in range(1, n_clientes + 1)],
+        "apellido_cliente": rng.choice(APELLIDOS, n_clientes),
+        "ciudad": rng.choice(CIUDADES, n_clientes, p=pesos_ciudad / pesos_ciudad.sum()),
+        "fecha_registro": fechas_aleatorias(rng, n_clientes, "2019-01-01", "2022-01-01"),
+    })
+    categorias = pd.DataFrame({
+        "id_categoria": np.arange(1, len(CATEGORIAS) + 1),
+        "nombre_categoria": CATEGORIAS,
+    })
+    productos = pd.DataFrame({
+        "id_producto": np.arange(1, n_productos + 1),
+        "nombre_producto": [f"Producto {i:05d}" for i in range(1, n_productos + 1)],
+        "precio_producto": rng.uniform(50, 1500, n_productos).round(2),
+        "id_categoria": rng.integers(1, len(CATEGORIAS) + 1, n_productos),
+    })
+
+    # Líneas de pedido: de 1 a 4 productos por pedido, sin repetir producto en el mismo pedido
+    ids_pedido = np.arange(1, n_pedidos + 1)
+    lineas = pd.DataFrame({
+        "id_pedido": np.repeat(ids_pedido, rng.integers(1, 5, n_pedidos)),
+    })
+    lineas["id_producto"] = rng.integers(1, n_productos + 1, len(lineas))
+    lineas = lineas.drop_duplicates(["id_pedido", "id_producto"], ignore_index=True)
+    lineas["cantidad"] = rng.integers(1, 4, len(lineas))
+    lineas["importe"] = lineas["cantidad"] * productos["precio_producto"].to_numpy()[lineas["id_producto"] - 1]
+    por_pedido = lineas.groupby("id_pedido").agg(total=("importe", "sum"), cantidad=("cantidad", "sum"))
+
+    clientes_sesgados = (rng.pareto(1.5, n_pedidos) * n_clientes / 20).astype(int) % n_clientes + 1
+    fechas_pedido = np.sort(fechas_aleatorias(rng, n_pedidos, "2022-01-01", "2025-01-01"))
+    pedidos = pd.DataFrame({
+        "id_pedido": ids_pedido,
+        "id_cliente": clientes_sesgados,
+        "fecha_pedido": fechas_pedido,
+        "total_pedido": por_pedido["total"].reindex(ids_pedido, fill_value=0).round(2).to_numpy(),
+        "direccion_envio": [f"Calle {i % 500} #{i % 97}" for i in ids_pedido],
+    })
+
+    ubicaciones = rng.integers(1, 4, n_productos)
+    inventario = pd.DataFrame({"id_producto": np.repeat(productos["id_producto"].to_numpy(), ubicaciones)})
+    inventario["id_ubicacion_almacen"] = inventario.groupby("id_producto").cumcount() + 1
+    inventario["cantidad_disponible"] = rng.integers(0, 500, len(inventario))
+    inventario.insert(0, "id_inventario", np.arange(1, len(inventario) + 1))
+
+    facturados = pedidos.sample(frac=0.9, random_state=semilla).sort_values("id_pedido")
+    facturacion = pd.DataFrame({
+        "id_facturacion": np.arange(1, len(facturados) + 1),
+        "id_detalle_pedido": facturados["id_pedido"].to_numpy(),
+        "monto_total": facturados["total_pedido"].to_numpy(),
+        "fecha_emision": facturados["fecha_pedido"].to_numpy()
+        + pd.to_timedelta(rng.integers(0, 3 * 86400, len(facturados)), unit="s"),
+        "razon_social": rng.choice(RAZONES_SOCIALES, len(facturados)),
+    })
+    detalle_pedido = pd.DataFrame({
+        "id_detalle_pedido": ids_pedido,
+        "id_cliente_pedido": ids_pedido,
+        "cantidad_producto": por_pedido["cantidad"].reindex(ids_pedido, fill_value=0).to_numpy(),
+    })
+    promociones = pd.DataFrame({
+        "id_promocion": np.arange(1, 31),
+        "nombre_promocion": [f"Promo {i}" for i in range(1, 31)],
+        "porcentaje_descuento": rng.integers(5, 51, 30),
+        "id_producto": rng.integers(1, n_productos + 1, 30),
+    })
+    historial = pd.DataFrame({
+        "id_historial": ids_pedido,
+        "id_pedido": ids_pedido,
+        "metodo_pago": rng.choice(METODOS_PAGO, n_pedidos),
+        "estado_final_pedido": rng.choice(ESTADOS_PEDIDO, n_pedidos, p=[0.8, 0.1, 0.07, 0.03]),
+    })
+    cargos = pd.DataFrame({"id_cargo_empleado": np.arange(1, len(CARGOS) + 1), "nombre_cargo": CARGOS})
+    empleados = pd.DataFrame({
+        "id_empleado": np.arange(1, 61),
+        "nombre_empleado": [f"Empleado{i}" for i in range(1, 61)],
+        "id_cargo_empleado": rng.integers(1, len(CARGOS) + 1, 60),
+    })
+    n_carritos = max(10, n_pedidos // 2)
+    carritos = pd.DataFrame({
+        "id_carrito_compras": np.arange(1, n_carritos + 1),
+        "id_cliente": rng.integers(1, n_clientes + 1, n_carritos),
+        "estado_carrito": rng.choice(ESTADOS_CARRITO, n_carritos),
+    })
+
+    return {
+        "categoria": categorias,
+        "producto": productos,
+        "cliente": clientes,
+        "pedido": pedidos,
+        "pedido_producto": lineas[["id_pedido", "id_producto"]],
+        "inventario": inventario,
+        "facturacion": facturacion,
+        "detalle_pedido": detalle_pedido,
+        "promocion": promociones,
+        "historial": historial,
+        "cargo_empleado": cargos,
+        "empleado": empleados,
+        "carrito_compras": carritos,
+    }
+
+
+def crear_base(engine, escala, semilla):
+    """Borra y vuelve a crear las tablas, y las llena con los datos sintéticos."""
+    with engine.begin() as conn:
+        for tabla in reversed(list(ESQUEMA)):
+            conn.execute(text(f"DROP TABLE IF EXISTS {tabla}"))
+        for ddl in ESQUEMA.values():
+            conn.execute(text(ddl))
+        for ddl in INDICES:
+            conn.execute(text(ddl))
+    datos = generar_datos(escala, semilla)
+    for tabla, df in datos.items():
+        df.to_sql(tabla, engine, if_exists="append", index=False, chunksize=10_000)
+    return {tabla: len(df) for tabla, df in datos.items()}
+
+
+def medir_etapa(funcion, repeticiones):
+    """Mediana de la latencia en ``repeticiones`` corridas y pico de memoria de una corrida extra.
+
+    La memoria se mide aparte porque ``tracemalloc`` hace más lenta cada asignación.
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tracemalloc.start()
+    try:
+        funcion()
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if isinstance(resultado, dict):
+        filas = sum(len(tabla) for tabla in resultado.values())
+    elif isinstance(resultado, (pd.DataFrame, pd.Series)):
+        filas = len(resultado)
+    else:
+        filas = None
+    return {"ms": statistics.median(tiempos), "pico_mb": pico / 2**20, "filas": filas}
+
+
+def filtros_representativos(modelo):
+    """Filtro típico del dashboard: dos ciudades, una categoría y la mitad central de las fechas."""
+    fechas = modelo["pedidos"]["fecha_pedido"].dropna().sort_values()
+    return {
+        "ciudades": sorted(modelo["clientes"]["ciudad"].dropna().unique())[:2],
+        "productos": [],
+        "categorias": sorted(modelo["productos"]["nombre_categoria"].dropna().unique())[:1],
+        "fecha_inicio": fechas.iloc[len(fechas) // 4].date(),
+        "fecha_fin": fechas.iloc[3 * len(fechas) // 4].date(),
+    }
+
+
+def correr_escala(engine, repeticiones):
+    """Mide todas las etapas sobre la base ya cargada y devuelve un registro por etapa."""
+    resultados = {}
+
+    def cargar():
+        with engine.connect() as conn:
+            return leer_modelo(conn)
+
+    resultados["carga_modelo"] = medir_etapa(cargar, repeticiones)
+    with engine.connect() as conn:
+        marcas = leer_marcas(conn)
+    modelo = cargar()
+
+    def sincronizar():
+        with engine.connect() as conn:
+            return combinar_modelo(modelo, leer_delta_modelo(conn, marcas))[0]
+
+    resultados["sincronizacion"] = medir_etapa(sincronizar, repeticiones)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        def escribir_snapshot():
+            guardar_snapshot(directorio, modelo, marcas, "benchmark")
+            return modelo
+
+        resultados["snapshot_escritura"] = medir_etapa(escribir_snapshot, repeticiones)
+        resultados["snapshot_lectura"] = medir_etapa(lambda: leer_snapshot(directorio)[0], repeticiones)
+        resultados["snapshot_proyeccion"] = medir_etapa(
+            lambda: leer_snapshot(directorio, columnas={"pedidos": ["fecha_pedido", "total_pedido"]})[0],
+            repeticiones,
+        )
+    filtros = filtros_representativos(modelo)
+    f = filtros
+
+    resultados["filtros_pandas"] = medir_etapa(
+        lambda: filtrar_pedidos(modelo, f["ciudades"], f["productos"], f["categorias"], f["fecha_inicio"], f["fecha_fin"]),
+        repeticiones,
+    )
+    # El índice se arma una vez por versión de los datos; la etapa no devuelve filas
+    resultados["indice_pedidos"] = medir_etapa(lambda: indexar_pedidos(modelo) and None, repeticiones)
+    indice_pedidos = indexar_pedidos(modelo)
+    resultados["filtros_indice"] = medir_etapa(
+        lambda: filtrar_modelo(
+            modelo, indice_pedidos, f["ciudades"], f["productos"], f["categorias"], f["fecha_inicio"], f["fecha_fin"]
+        )[0],
+        repeticiones,
+    )
+
+    # Modo ASARTI_FILTROS_SQL=1: el modelo restringido a los pedidos filtrados, leído de la base
+    def modelo_filtrado():
+        with engine.connect() as conn:
+            return leer_modelo_filtrado(
+                conn, f["ciudades"], f["productos"], f["categorias"], f["fecha_inicio"], f["fecha_fin"]
+            )
+
+    resultados["filtros_sql"] = medir_etapa(modelo_filtrado, repeticiones)
+
+    def rollup():
+        with engine.connect() as conn:
+            return leer_rollup(conn, 0)[0]
+
+    resultados["rollup"] = medir_etapa(rollup, repeticiones)
+    resumen = rollup()
+    resultados["rollup_filtrado"] = medir_etapa(
+        lambda: filtrar_rollup(resumen, f["ciudades"], f["productos"], f["categorias"], f["fecha_inicio"], f["fecha_fin"]),
+        repeticiones,
+    )
+    resultados["indice_rollup"] = medir_etapa(lambda: indexar_rollup(resumen) and None, repeticiones)
+    indice_rollup = indexar_rollup(resumen)
+    resultados["rollup_filtrado_indice"] = medir_etapa(
+        lambda: filtrar_rollup(
+            resumen, f["ciudades"], f["productos"], f["categorias"], f["fecha_inicio"], f["fecha_fin"], indice=indice_rollup
+        ),
+        repeticiones,
+    )
+
+    pedidos = filtrar_pedidos(modelo, f["ciudades"], f["productos"], f["categorias"], f["fecha_inicio"], f["fecha_fin"])
+    lineas = seleccionar_lineas(modelo, f["productos"], f["categorias"])
+    lineas = lineas[lineas["id_pedido"].isin(pedidos["id_pedido"])]
+    resumen_filtrado = filtrar_rollup(resumen, f["ciudades"], f["productos"], f["categorias"], f["fecha_inicio"], f["fecha_fin"])
+
+    def indicadores():
+        inventario = modelo["inventario"]
+        return [
+            resumen_filtrado["total_pedido"].sum(),
+            inventario.loc[inventario["id_producto"].isin(lineas["id_producto"]), "cantidad_disponible"].sum(),
+            pedidos["id_cliente"].nunique(),
+            resumen_filtrado.groupby("nombre_producto", observed=True)["total_pedido"].sum(),
+            resumen_filtrado.groupby("ciudad", observed=True)["total_pedido"].sum(),
+            resumen_filtrado.groupby("nombre_categoria", observed=True)["total_pedido"].sum(),
+        ]
+
+    resultados["indicadores"] = medir_etapa(indicadores, repeticiones)
+    resultados["vista_detalle"] = medir_etapa(lambda: vista_detalle(modelo, pedidos, lineas), repeticiones)
+
+    def consultar(nombre, filtros=None):
+        with engine.connect() as conn:
+            return consultar_reporte(conn, nombre, filtros)
+
+    for report_name in REPORTES:
+        resultados[f"reporte:{report_name}"] = medir_etapa(lambda n=report_name: consultar(n), repeticiones)
+    for report_name in REPORTES:
+        resultados[f"reporte_filtrado:{report_name}"] = medir_etapa(lambda n=report_name: consultar(n, f), repeticiones)
+    return resultados
+
+
+def imprimir(resultados, base=None):
+    """Tabla por etapa y escala; con ``base`` agrega la variación porcentual de la latencia."""
+    filas = []
+    for escala, etapas in resultados["escalas"].items():
+        for etapa, medida in etapas["etapas"].items():
+            fila = {"escala": escala, "etapa": etapa, **medida}
+            anterior = (base or {}).get("escalas", {}).get(escala, {}).get("etapas", {}).get(etapa)
+            if anterior:
+                fila["vs_base_%"] = (medida["ms"] / anterior["ms"] - 1) * 100 if anterior["ms"] else None
+            filas.append(fila)
+    tabla = pd.DataFrame(filas).astype({"filas": "Int64"})
+    with pd.option_context("display.max_rows", None, "display.width", 160, "display.float_format", "{:,.2f}".format):
+        print(tabla.to_string(index=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escalas", type=float, nargs="+", default=[1, 10], help="miles de pedidos por escala")
+    parser.add_argument("--url", help="URL de SQLAlchemy de una base local; por defecto un SQLite temporal por escala")
+    parser.add_argument("--directorio", default=tempfile.gettempdir(), help="dónde crear los SQLite")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--reutilizar", action="store_true", help="no regenerar los datos si la base ya existe")
+    parser.add_argument("--salida", help="archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para comparar latencias")
+    args = parser.parse_args()
+
+    if args.url and make_url(args.url).database == BASE_PROTEGIDA and not args.reutilizar:
+        parser.error(f"la base {BASE_PROTEGIDA!r} es la de producción; usa otra base o --reutilizar")
+
+    resultados = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "semilla": args.semilla,
+        "repeticiones": args.repeticiones,
+        "escalas": {},
+    }
+    for escala in args.escalas:
+        if args.url:
+            url = args.url
+        else:
+            url = f"sqlite:///{os.path.join(args.directorio, f'asarti_bench_{escala:g}k.db')}"
+        engine = create_engine(url)
+        if engine.dialect.name == "sqlite":
+            registrar_funciones_sqlite(engine)
+
+        inicio = time.perf_counter()
+        if args.reutilizar:
+            filas = None
+        else:
+            filas = crear_base(engine, escala, args.semilla)
+        generacion = time.perf_counter() - inicio
+        print(f"Escala {escala:g}k: base en {engine.url.render_as_string(hide_password=True)} ({generacion:.1f} s)")
+
+        resultados["escalas"][f"{escala:g}"] = {
+            "filas": filas,
+            "etapas": correr_escala(engine, args.repeticiones),
+        }
+        engine.dispose()
+
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            base = json.load(archivo)
+    imprimir(resultados, base)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, ensure_ascii=False, indent=2)
+        print(f"Resultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+# Los módulos del dashboard están en la raíz del repositorio, sin paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asarti_datos import registrar_funciones_sqlite  # noqa: E402
+from benchmark import crear_base  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """SQLite con el esquema y los datos sintéticos del benchmark (200 pedidos)."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'asarti.db'}")
+    registrar_funciones_sqlite(engine)
+    crear_base(engine, 0.2, 7)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,127 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from asarti_datos import (
+    CLAVES_MODELO,
+    combinar_modelo,
+    guardar_snapshot_rollup,
+    leer_delta_modelo,
+    leer_marcas,
+    leer_modelo,
+    leer_rollup,
+    leer_snapshot_rollup,
+)
+
+
+def normalizar(tabla, claves):
+    """Tabla comparable sin importar el orden de las filas ni las categorías de cada lectura."""
+    tabla = tabla.astype({columna: object for columna in tabla.columns if isinstance(tabla[columna].dtype, pd.CategoricalDtype)})
+    return tabla.sort_values(list(tabla.columns)).sort_values(claves, kind="stable").reset_index(drop=True)
+
+
+# Un cliente nuevo sin ciudad llega en un bloque con la categórica vacía
+@pytest.mark.parametrize("ciudad", ["Nueva Ciudad", None])
+def test_combinar_modelo_igual_a_lectura_completa(engine, ciudad):
+    with engine.connect() as conn:
+        marcas = leer_marcas(conn)
+        modelo = leer_modelo(conn)
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO cliente (id_cliente, nombre_cliente, apellido_cliente, ciudad, fecha_registro)"
+            " VALUES (100000, 'Ana', 'Quispe', :ciudad, '2025-01-02 10:00:00')"
+        ), {"ciudad": ciudad})
+        conn.execute(text(
+            "INSERT INTO pedido (id_pedido, id_cliente, fecha_pedido, total_pedido, direccion_envio)"
+            " VALUES (100000, 100000, '2025-01-03 11:00:00', 123.45, 'Calle 1')"
+        ))
+        conn.execute(text("INSERT INTO pedido_producto (id_pedido, id_producto) VALUES (100000, 1), (100000, 2)"))
+        # Línea que llega después de que su pedido ya se sincronizó
+        conn.execute(text(
+            "INSERT INTO pedido_producto (id_pedido, id_producto) VALUES (:id_pedido, 3)"
+        ), {"id_pedido": marcas["id_pedido"]})
+        conn.execute(text(
+            "INSERT INTO facturacion (id_facturacion, id_detalle_pedido, monto_total, fecha_emision, razon_social)"
+            " VALUES (100000, 100000, 123.45, '2030-01-03 12:00:00', 'Quispe')"
+        ))
+        # Factura reemitida: misma clave, fecha posterior a la marca
+        conn.execute(text(
+            "UPDATE facturacion SET monto_total = 1.00, fecha_emision = '2030-01-04 09:00:00'"
+            " WHERE id_facturacion = (SELECT MIN(id_facturacion) FROM facturacion)"
+        ))
+        # Tablas que se leen completas
+        conn.execute(text("UPDATE producto SET nombre_producto = 'Renombrado', precio_producto = 9.99 WHERE id_producto = 1"))
+        conn.execute(text("UPDATE inventario SET cantidad_disponible = cantidad_disponible + 5"))
+        conn.execute(text("DELETE FROM inventario WHERE id_inventario = (SELECT MAX(id_inventario) FROM inventario)"))
+
+    with engine.connect() as conn:
+        delta = leer_delta_modelo(conn, marcas)
+        completo = leer_modelo(conn)
+    combinado, cambios = combinar_modelo(modelo, delta)
+
+    assert cambios > 0
+    for nombre, claves in CLAVES_MODELO.items():
+        pd.testing.assert_frame_equal(
+            normalizar(combinado[nombre], claves), normalizar(completo[nombre], claves), obj=nombre
+        )
+
+
+def test_combinar_modelo_sin_cambios(engine):
+    with engine.connect() as conn:
+        marcas = leer_marcas(conn)
+        modelo = leer_modelo(conn)
+        delta = leer_delta_modelo(conn, marcas)
+    combinado, cambios = combinar_modelo(modelo, delta)
+    assert cambios == 0
+    assert all(combinado[nombre] is modelo[nombre] for nombre in modelo)
+
+
+def test_rollup_reparte_totales_enteros_sin_perder_centavos(engine):
+    with engine.begin() as conn:
+        # SQLite guarda como INTEGER un total sin decimales; con división entera 7 / 2 daría 3 + 3
+        conn.execute(text(
+            "UPDATE pedido SET total_pedido = 7 WHERE id_pedido IN"
+            " (SELECT id_pedido FROM pedido_producto GROUP BY id_pedido HAVING COUNT(*) > 1)"
+        ))
+    with engine.connect() as conn:
+        rollup, _ = leer_rollup(conn, 0)
+        esperado = conn.execute(text(
+            "SELECT SUM(p.total_pedido) FROM pedido p JOIN cliente c ON c.id_cliente = p.id_cliente"
+        )).scalar()
+    assert rollup["total_pedido"].sum() == pytest.approx(float(esperado))
+
+
+# Sin precio que sumar en el pedido, el total se reparte en partes iguales
+@pytest.mark.parametrize("precios, esperado", [
+    ((30, 10), {1: 75.0, 2: 25.0}),
+    ((0, 0), {1: 50.0, 2: 50.0}),
+    ((None, None), {1: 50.0, 2: 50.0}),
+])
+def test_rollup_reparte_total_segun_precio(engine, precios, esperado):
+    with engine.begin() as conn:
+        desde = conn.execute(text("SELECT MAX(id_pedido) FROM pedido")).scalar()
+        conn.execute(text(
+            "INSERT INTO pedido (id_pedido, id_cliente, fecha_pedido, total_pedido, direccion_envio)"
+            " VALUES (100000, (SELECT MIN(id_cliente) FROM cliente), '2031-01-01 10:00:00', 100, 'Calle 1')"
+        ))
+        conn.execute(text("INSERT INTO pedido_producto (id_pedido, id_producto) VALUES (100000, 1), (100000, 2)"))
+        for id_producto, precio in zip((1, 2), precios):
+            conn.execute(
+                text("UPDATE producto SET precio_producto = :precio WHERE id_producto = :id_producto"),
+                {"precio": precio, "id_producto": id_producto},
+            )
+    with engine.connect() as conn:
+        rollup, _ = leer_rollup(conn, desde)
+    assert rollup.set_index("id_producto")["total_pedido"].to_dict() == pytest.approx(esperado)
+
+
+def test_snapshot_rollup_conserva_resumen_y_marca(engine, tmp_path):
+    with engine.connect() as conn:
+        rollup, hasta = leer_rollup(conn, 0)
+    guardar_snapshot_rollup(tmp_path, rollup, hasta, "huella")
+
+    leido, manifiesto = leer_snapshot_rollup(tmp_path, "huella")
+    pd.testing.assert_frame_equal(leido, rollup)
+    assert manifiesto["marcas"]["id_pedido"] == hasta
+    assert leer_snapshot_rollup(tmp_path, "otra huella") == (None, None)
@@ -0,0 +1,58 @@
+import gzip
+import io
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+from asarti_exportar import FORMATOS_EXPORTACION, bloques_dataframe, exportar
+
+
+@pytest.fixture
+def datos():
+    return pd.DataFrame(
+        {
+            "id_pedido": pd.array([1, 2, None, 4, 5], dtype="Int32"),
+            "ciudad": pd.Categorical(["La Paz", "Oruro", "La Paz", None, "Sucre"]),
+            "fecha_pedido": pd.to_datetime(["2024-01-01", None, "2024-02-03", "2024-03-04", "2024-05-06"]),
+            "total_pedido": [10.5, 20.0, 30.25, None, 50.0],
+        }
+    )
+
+
+def leer(contenido, formato):
+    if formato == "csv":
+        return pd.read_csv(io.BytesIO(gzip.decompress(contenido)))
+    if formato == "parquet":
+        return pd.read_parquet(io.BytesIO(contenido))
+    return pd.read_excel(io.BytesIO(contenido))
+
+
+@pytest.mark.parametrize("formato", list(FORMATOS_EXPORTACION))
+def test_exportar_es_aceptado_por_download_button(datos, formato):
+    if formato == "xlsx":
+        pytest.importorskip("openpyxl")
+    contenido = exportar(bloques_dataframe(datos, filas=2), formato)
+    # Lo mismo que hace Streamlit con el resultado de una descarga diferida
+    como_bytes, _ = convert_data_to_bytes_and_infer_mime(contenido, RuntimeError("tipo no soportado"))
+    assert como_bytes == contenido
+    leido = leer(como_bytes, formato)
+    assert list(leido.columns) == list(datos.columns)
+    assert len(leido) == len(datos)
+
+
+@pytest.mark.parametrize("formato", list(FORMATOS_EXPORTACION))
+def test_exportar_vacio_conserva_columnas(datos, formato):
+    if formato == "xlsx":
+        pytest.importorskip("openpyxl")
+    leido = leer(exportar(bloques_dataframe(datos.iloc[:0]), formato), formato)
+    assert list(leido.columns) == list(datos.columns)
+    assert leido.empty
+
+
+def test_exportar_parquet_con_decimales_de_precision_creciente():
+    # Lo que devuelve MySQL para un SUM sobre DECIMAL: el primer bloque fija el esquema
+    datos = pd.DataFrame({"monto": [Decimal("1.5"), None, Decimal("123456.789"), Decimal("98765432.1234")]})
+    leido = leer(exportar(bloques_dataframe(datos, filas=1), "parquet"), "parquet")
+    assert leido["monto"].tolist() == pytest.approx([1.5, float("nan"), 123456.789, 98765432.1234], nan_ok=True)
@@ -0,0 +1,93 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from asarti_datos import (
+    filtrar_modelo,
+    filtrar_pedidos,
+    filtrar_rollup,
+    indexar_pedidos,
+    indexar_rollup,
+    leer_modelo,
+    leer_modelo_filtrado,
+    leer_rollup,
+    seleccionar_lineas,
+)
+
+
+@pytest.fixture
+def datos(engine):
+    with engine.begin() as conn:
+        # Pedido sin fecha (NaT en el modelo) y pedido de un cliente que no existe
+        conn.execute(text(
+            "INSERT INTO pedido (id_pedido, id_cliente, fecha_pedido, total_pedido, direccion_envio)"
+            " VALUES (100000, 1, NULL, 10, 'Sin fecha'), (100001, 999999, '2023-05-05 10:00:00', 20, 'Huérfano')"
+        ))
+        conn.execute(text("INSERT INTO pedido_producto (id_pedido, id_producto) VALUES (100000, 1), (100001, 2)"))
+    with engine.connect() as conn:
+        modelo = leer_modelo(conn)
+        rollup, _ = leer_rollup(conn, 0)
+    return modelo, rollup
+
+
+def combinaciones(modelo):
+    clientes = modelo["clientes"]
+    productos = modelo["productos"]
+    ciudad = clientes["ciudad"].dropna().iloc[0]
+    producto = productos["nombre_producto"].iloc[0]
+    categoria = productos["nombre_categoria"].dropna().iloc[0]
+    otra_categoria = productos.loc[productos["nombre_categoria"] != categoria, "nombre_categoria"].dropna().iloc[0]
+    return {
+        "sin_filtros": ([], [], [], None, None),
+        "ciudad": ([ciudad], [], [], None, None),
+        "producto_y_categoria": ([], [producto], [categoria], None, None),
+        "producto_de_otra_categoria": ([], [producto], [otra_categoria], None, None),
+        "rango_de_fechas": ([], [], [], date(2023, 1, 1), date(2023, 12, 31)),
+        "todo": ([ciudad], [producto], [categoria], date(2022, 1, 1), date(2024, 12, 31)),
+        "valores_desconocidos": (["Atlántida"], ["Producto inexistente"], [], None, None),
+        "ciudad_desconocida_y_conocida": (["Atlántida", ciudad], [], [], None, None),
+    }
+
+
+def test_indice_de_pedidos_igual_a_mascaras(datos):
+    modelo, _ = datos
+    indice = indexar_pedidos(modelo)
+    for nombre, filtros in combinaciones(modelo).items():
+        pedidos = filtrar_pedidos(modelo, *filtros)
+        lineas = seleccionar_lineas(modelo, filtros[1], filtros[2])
+        lineas = lineas[lineas["id_pedido"].isin(pedidos["id_pedido"])]
+
+        pedidos_indice, lineas_indice = filtrar_modelo(modelo, indice, *filtros)
+        assert pedidos_indice.equals(pedidos), nombre
+        assert lineas_indice.equals(lineas), nombre
+
+
+def test_modelo_filtrado_en_sql_igual_a_indice(datos, engine):
+    modelo, _ = datos
+    indice = indexar_pedidos(modelo)
+    for nombre, filtros in combinaciones(modelo).items():
+        pedidos, lineas = filtrar_modelo(modelo, indice, *filtros)
+        with engine.connect() as conn:
+            filtrado = leer_modelo_filtrado(conn, *filtros)
+        lineas_sql = seleccionar_lineas(filtrado, filtros[1], filtros[2])
+
+        assert sorted(filtrado["pedidos"]["id_pedido"]) == sorted(pedidos["id_pedido"]), nombre
+        assert sorted(zip(lineas_sql["id_pedido"], lineas_sql["id_producto"])) == sorted(
+            zip(lineas["id_pedido"], lineas["id_producto"])
+        ), nombre
+        assert set(filtrado["clientes"]["id_cliente"]) == set(pedidos["id_cliente"]), nombre
+
+
+def test_rango_de_fechas_excluye_nat(datos):
+    modelo, _ = datos
+    pedidos, _ = filtrar_modelo(modelo, indexar_pedidos(modelo), [], [], [], date(2000, 1, 1), date(2100, 1, 1))
+    assert pedidos["fecha_pedido"].notna().all()
+    assert 100000 not in pedidos["id_pedido"].tolist()
+
+
+def test_indice_de_rollup_igual_a_mascaras(datos):
+    modelo, rollup = datos
+    indice = indexar_rollup(rollup)
+    for nombre, filtros in combinaciones(modelo).items():
+        assert filtrar_rollup(rollup, *filtros, indice=indice).equals(filtrar_rollup(rollup, *filtros)), nombre